@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Benchmarks redaction and password hashing
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+import encrypt_password
+from filtered_logger import RedactingFormatter, filter_datum
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Times repeated calls of func
+
+    Args:
+        func (Callable[[], object]): operation to time
+        repeat (int): number of calls
+
+    Returns:
+        Dict[str, float]: ops/sec and latency percentiles in microseconds
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, len(samples), sum(samples))
+
+
+def summarize(
+    samples: List[float],
+    ops: int,
+    elapsed: float
+) -> Dict[str, float]:
+    """Builds the result entry for a list of latency samples"""
+    samples = sorted(samples)
+
+    def pct(p: float) -> float:
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1e6
+
+    return {
+        "ops": ops,
+        "ops_per_sec": ops / elapsed if elapsed > 0 else 0.0,
+        "mean_us": statistics.mean(samples) * 1e6,
+        "p50_us": pct(0.50),
+        "p95_us": pct(0.95),
+        "p99_us": pct(0.99),
+    }
+
+
+def make_message(n_fields: int, pii_ratio: float, value_len: int) -> tuple:
+    """Builds a `key=value;` message and the list of PII fields in it
+
+    Args:
+        n_fields (int): number of fields in the message
+        pii_ratio (float): share of fields to redact
+        value_len (int): length of every value
+
+    Returns:
+        tuple: (fields to redact, message)
+    """
+    names = ["field{}".format(i) for i in range(n_fields)]
+    pii = names[:max(1, round(n_fields * pii_ratio))]
+    random.shuffle(names)
+    value = "x" * value_len
+    message = "".join("{}={};".format(name, value) for name in names)
+    return pii, message
+
+
+def bench_redaction(repeat: int) -> List[dict]:
+    """Benchmarks filter_datum and RedactingFormatter.format"""
+    results = []
+    for n_fields in (5, 20, 50):
+        for pii_ratio in (0.1, 0.5, 1.0):
+            for value_len in (8, 64, 512):
+                pii, message = make_message(n_fields, pii_ratio, value_len)
+                params = {"fields": n_fields, "pii_ratio": pii_ratio,
+                          "message_len": len(message)}
+                result = measure(
+                    lambda: filter_datum(pii, "***", message, ";"), repeat)
+                results.append(dict(name="filter_datum", **params, **result))
+
+                formatter = RedactingFormatter(pii)
+                record = logging.LogRecord("user_data", logging.INFO,
+                                           __file__, 0, message, None, None)
+                result = measure(lambda: formatter.format(record), repeat)
+                results.append(dict(name="RedactingFormatter.format",
+                                    **params, **result))
+    return results
+
+
+def _timed_hash(password: str) -> float:
+    """Returns the seconds taken by hash_password"""
+    start = time.perf_counter()
+    encrypt_password.hash_password(password)
+    return time.perf_counter() - start
+
+
+def bench_hashing(repeat: int, costs: List[int],
+                  concurrency: List[int]) -> List[dict]:
+    """Benchmarks hash_password, is_valid and their batch versions
+
+    The ops/sec of a batch is its throughput, its percentiles are the
+    latencies of single hashes running on the pool.
+    """
+    results = []
+    for cost in costs:
+        encrypt_password._cost = cost
+        hashed = encrypt_password.hash_password("benchmark")
+        result = measure(lambda: encrypt_password.hash_password("benchmark"),
+                         repeat)
+        results.append(dict(name="hash_password", cost=cost, **result))
+        result = measure(lambda: encrypt_password.is_valid(hashed,
+                                                           "benchmark"),
+                         repeat)
+        results.append(dict(name="is_valid", cost=cost, **result))
+
+        for workers in concurrency:
+            # same pool as hash_passwords, each hash timed in its worker:
+            # the gaps between results would mostly measure how many
+            # hashes ran alongside
+            n = repeat * workers
+            start = time.perf_counter()
+            samples = list(encrypt_password._ordered_map(
+                _timed_hash, [("benchmark",)] * n, workers))
+            elapsed = time.perf_counter() - start
+            results.append(dict(name="hash_passwords", cost=cost,
+                                concurrency=workers,
+                                **summarize(samples, n, elapsed)))
+    encrypt_password._cost = None
+    return results
+
+
+def main():
+    """Entry point"""
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark redaction and password hashing")
+    parser.add_argument("-o", "--output", default="benchmark.json",
+                        help="JSON results file")
+    parser.add_argument("--repeat", type=int, default=1000,
+                        help="calls per redaction case")
+    parser.add_argument("--hash-repeat", type=int, default=5,
+                        help="calls per hashing case")
+    parser.add_argument("--costs", default="10,12",
+                        help="comma separated bcrypt costs")
+    parser.add_argument("--concurrency", default="1,2,4",
+                        help="comma separated batch hashing workers")
+    parser.add_argument("--skip-hashing", action="store_true",
+                        help="only run the redaction benchmarks")
+    args = parser.parse_args()
+
+    results = bench_redaction(args.repeat)
+    if not args.skip_hashing:
+        results += bench_hashing(
+            args.hash_repeat,
+            [int(c) for c in args.costs.split(",")],
+            [int(c) for c in args.concurrency.split(",")])
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        name = result["name"]
+        params = ", ".join("{}={}".format(k, v) for k, v in result.items()
+                           if k in ("fields", "pii_ratio", "message_len",
+                                    "cost", "concurrency"))
+        print("{:<28} {:<45} {:>12.0f} ops/s  p99 {:>10.1f} us".format(
+            name, params, result["ops_per_sec"], result["p99_us"]),
+            file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Defines a small database connection pool
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled connection, close() hands it back to the pool
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: Any):
+        """Init method"""
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name: str) -> Any:
+        """Delegates everything else to the real connection"""
+        if self._conn is None:
+            raise AttributeError("connection returned to the pool")
+        return getattr(self._conn, name)
+
+    def close(self) -> None:
+        """Returns the connection to the pool"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self) -> 'PooledConnection':
+        """Context manager entry"""
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """Context manager exit"""
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections with health checks on checkout
+    and idle eviction
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 5,
+        idle_timeout: float = 300
+    ):
+        """Init method
+
+        Args:
+            factory (Callable[[], Any]): opens a new connection
+            size (int, optional): max connections checked out at once.
+                Defaults to 5.
+            idle_timeout (float, optional): seconds after which an idle
+                connection is closed. Defaults to 300.
+        """
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.pid = os.getpid()
+
+    def get(self, timeout: float = None) -> PooledConnection:
+        """Checks a healthy connection out of the pool
+
+        Args:
+            timeout (float, optional): seconds to wait for a free slot.
+                Defaults to waiting forever.
+
+        Raises:
+            TimeoutError: if no connection became free in time
+
+        Returns:
+            PooledConnection: connection proxy
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("connection pool exhausted")
+        try:
+            self._evict_idle()
+            while True:
+                with self._lock:
+                    conn = self._idle.pop()[1] if self._idle else None
+                if conn is None:
+                    conn = self.factory()
+                    break
+                if self._is_healthy(conn):
+                    break
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn: Any) -> None:
+        """Puts a connection back in the pool, rolling back what the
+        borrower left uncommitted. A connection that cannot be rolled
+        back is closed instead.
+
+        Args:
+            conn (Any): connection previously checked out
+        """
+        try:
+            if self._rollback(conn):
+                with self._lock:
+                    self._idle.append((time.monotonic(), conn))
+            else:
+                self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """Closes every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for _, conn in idle:
+            self._discard(conn)
+
+    def _evict_idle(self) -> None:
+        """Closes connections idle for longer than idle_timeout"""
+        limit = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            while self._idle and self._idle[0][0] < limit:
+                expired.append(self._idle.popleft()[1])
+        for conn in expired:
+            self._discard(conn)
+
+    @staticmethod
+    def _is_healthy(conn: Any) -> bool:
+        """Returns True if the connection still answers"""
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _rollback(conn: Any) -> bool:
+        """Returns True if the open transaction, if any, was rolled back
+        (False with unread results or a broken connection)
+        """
+        try:
+            conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _discard(conn: Any) -> None:
+        """Closes a connection, ignoring errors"""
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -1,7 +1,100 @@
 #!/usr/bin/env python3
 """Bcrypt utility functions"""
+import os
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
+
 import bcrypt
 
+# bcrypt's own default, calibration only ever raises it
+MIN_COST = 12
+MAX_COST = 16
+_cost = None
+
+
+def calibrate_cost(
+    target: float = 0.25,
+    min_cost: int = MIN_COST,
+    max_cost: int = MAX_COST,
+    samples: int = 3
+) -> int:
+    """Benchmarks this host and returns the highest bcrypt cost whose
+    hashing time fits the target latency
+
+    Each extra cost round doubles the work, so the benchmark stops as
+    soon as the next cost would be predicted to exceed the target. Each
+    cost is timed as the median of a few hashes to ignore outliers.
+
+    Args:
+        target (float, optional): latency budget in seconds.
+            Defaults to 0.25.
+        min_cost (int, optional): lowest cost ever returned.
+        max_cost (int, optional): highest cost ever returned.
+        samples (int, optional): hashes timed per cost. Defaults to 3.
+
+    Returns:
+        int: bcrypt cost factor
+    """
+    cost = min_cost
+    while cost < max_cost:
+        if _hash_seconds(cost, samples) * 2 > target:
+            break
+        cost += 1
+    return cost
+
+
+def _hash_seconds(cost: int, samples: int) -> float:
+    """Returns the median time of `samples` hashes at a bcrypt cost"""
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(cost))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def get_cost() -> int:
+    """Returns the bcrypt cost in use, calibrating it on first call
+
+    The calibration target is read from BCRYPT_TARGET_SECONDS, and
+    BCRYPT_COST skips calibration altogether.
+    """
+    global _cost
+    if _cost is None:
+        if os.getenv('BCRYPT_COST'):
+            _cost = int(os.getenv('BCRYPT_COST'))
+        else:
+            _cost = calibrate_cost(
+                float(os.getenv('BCRYPT_TARGET_SECONDS') or 0.25))
+    return _cost
+
+
+def hash_cost(hashed_password: bytes) -> int:
+    """Returns the cost factor a bcrypt hash was made with
+
+    Args:
+        hashed_password (bytes): hash such as b"$2b$12$..."
+
+    Returns:
+        int: cost factor
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """Checks if a hash was made with a cost lower than the current one
+
+    Args:
+        hashed_password (bytes): hashed password
+
+    Returns:
+        bool: True if the password should be hashed again
+    """
+    return hash_cost(hashed_password) < get_cost()
+
 
 def hash_password(password: str) -> bytes:
     """Hashes a password
@@ -12,7 +105,7 @@ def hash_password(password: str) -> bytes:
     Returns:
         bytes: hashed password
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(get_cost())
     return bcrypt.hashpw(password.encode(), salt)
 
 
@@ -27,3 +120,79 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
         bool: True if password is valid, False otherwise
     """
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def verify_password(
+    hashed_password: bytes,
+    password: str
+) -> Tuple[bool, bool]:
+    """Checks a password and whether its hash should be upgraded
+
+    Args:
+        hashed_password (bytes): hashed password
+        password (str): password
+
+    Returns:
+        Tuple[bool, bool]: validity, and True if the password is valid
+            but was hashed with an outdated cost
+    """
+    if not is_valid(hashed_password, password):
+        return False, False
+    return True, needs_rehash(hashed_password)
+
+
+def _ordered_map(
+    func: Callable,
+    items: Iterable,
+    concurrency: int = None
+) -> Iterator:
+    """Maps func over items on a thread pool, yielding results in order
+    while keeping at most 2 * concurrency items in flight
+
+    bcrypt releases the GIL while hashing, so threads scale across cores.
+    """
+    if concurrency is None:
+        concurrency = os.cpu_count() or 1
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, *item))
+            if len(pending) >= 2 * concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def hash_passwords(
+    passwords: Iterable[str],
+    concurrency: int = None
+) -> Iterator[bytes]:
+    """Hashes many passwords in parallel
+
+    Args:
+        passwords (Iterable[str]): passwords to hash
+        concurrency (int, optional): worker threads. Defaults to CPU count.
+
+    Yields:
+        bytes: hashed passwords, in input order
+    """
+    get_cost()
+    return _ordered_map(hash_password, ((p,) for p in passwords), concurrency)
+
+
+def verify_passwords(
+    pairs: Iterable[Tuple[bytes, str]],
+    concurrency: int = None
+) -> Iterator[bool]:
+    """Checks many passwords in parallel
+
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): (hashed_password, password)
+        concurrency (int, optional): worker threads. Defaults to CPU count.
+
+    Yields:
+        bool: validity of each pair, in input order
+    """
+    return _ordered_map(is_valid, pairs, concurrency)
@@ -2,14 +2,34 @@
 """
 Defines the filter_datum function
 """
+import argparse
+import atexit
+import copy
 import logging
+import logging.handlers
+import math
 import os
+import queue
 import re
-from typing import List
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import (Callable, Iterable, Iterator, List, Mapping, Sequence,
+                    TextIO, Tuple)
 
 import mysql.connector
 
+from connection_pool import ConnectionPool
+
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
+_pool = None
+_connection_factory = None
 
 
 def filter_datum(
@@ -29,10 +49,41 @@ def filter_datum(
     Returns:
         str: log message
     """
-    for field in fields:
-        repl = field + "=" + redaction + separator
-        message = re.sub(field + r"=.*?" + separator, repl, message)
-    return message
+    return get_redactor(fields, redaction, separator)(message)
+
+
+def get_redactor(
+    fields: List[str],
+    redaction: str,
+    separator: str
+) -> Callable[[str], str]:
+    """Returns a callable that obfuscates a log message in a single pass
+
+    Args:
+        fields (List[str]): all fields to obfuscate
+        redaction (str): what the field will be obfuscated with
+        separator (str): separator string
+
+    Returns:
+        Callable[[str], str]: redacting function
+    """
+    return _compile_redactor(tuple(fields), redaction, separator)
+
+
+@lru_cache(maxsize=128)
+def _compile_redactor(
+    fields: Tuple[str, ...],
+    redaction: str,
+    separator: str
+) -> Callable[[str], str]:
+    """Compiles the redaction pattern once per (fields, redaction, separator)
+    """
+    if len(fields) == 0:
+        return lambda message: message
+    pattern = re.compile("({})=.*?{}".format(
+        "|".join(map(re.escape, fields)), re.escape(separator)))
+    repl = r"\1=" + (redaction + separator).replace("\\", r"\\")
+    return partial(pattern.sub, repl)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -48,29 +99,250 @@ class RedactingFormatter(logging.Formatter):
         """Init method"""
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self._redact = get_redactor(fields, self.REDACTION, self.SEPARATOR)
+        self._field_set = frozenset(fields)
 
     def format(self, record: logging.LogRecord) -> str:
         """Formats a log record
 
+        Records carrying a mapping of fields, either as
+        `extra={"data": mapping}` or as a dict passed in place of the
+        message arguments with an empty message, are redacted by key
+        before formatting instead of being scanned.
+
         Args:
             record (logging.LogRecord): log record
 
         Returns:
             str: formatted record
         """
+        data = structured_data(record)
+        if data is not None:
+            return self._format_structured(record, data)
         message = super(RedactingFormatter, self).format(record)
-        return filter_datum(
-            self.fields, self.REDACTION, message, self.SEPARATOR
-        )
+        return self._redact(message)
 
+    def format_batch(self, records: Iterable[logging.LogRecord]) -> str:
+        """Formats several log records and redacts them in one pass
 
-def get_logger() -> logging.Logger:
-    """Returns logger object"""
+        Args:
+            records (Iterable[logging.LogRecord]): log records
+
+        Returns:
+            str: formatted records, one per line
+        """
+        fmt = super(RedactingFormatter, self).format
+        lines = []
+        scan = False
+        for record in records:
+            data = structured_data(record)
+            if data is not None:
+                lines.append(self._format_structured(record, data))
+            else:
+                lines.append(fmt(record))
+                scan = True
+        text = "\n".join(lines)
+        return self._redact(text) if scan else text
+
+    def format_fields(self, data: Mapping) -> str:
+        """Builds a `key=value;` message, redacting values by key
+
+        Args:
+            data (Mapping): field names and values
+
+        Returns:
+            str: redacted log message
+        """
+        redacted = self._field_set
+        return format_row(data.keys(), (
+            self.REDACTION if k in redacted else v for k, v in data.items()
+        ))
+
+    def _format_structured(
+        self,
+        record: logging.LogRecord,
+        data: Mapping
+    ) -> str:
+        """Formats a structured record without scanning its text"""
+        record = copy.copy(record)
+        record.msg = self.format_fields(data)
+        record.args = None
+        return super(RedactingFormatter, self).format(record)
+
+
+def structured_data(record: logging.LogRecord) -> Mapping:
+    """Returns the fields mapping of a structured record
+
+    Args:
+        record (logging.LogRecord): log record
+
+    Returns:
+        Mapping: fields mapping, None for plain text records
+    """
+    data = getattr(record, "data", None)
+    if isinstance(data, Mapping):
+        return data
+    if not record.msg and isinstance(record.args, Mapping):
+        return record.args
+    return None
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that only enqueues records, leaving formatting
+    and redaction to the listener thread
+    """
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        block: bool = False,
+        timeout: float = None
+    ):
+        """Init method
+
+        Args:
+            log_queue (queue.Queue): bounded queue shared with the listener
+            block (bool, optional): wait for room when the queue is full
+                instead of dropping the record. Defaults to False.
+            timeout (float, optional): max seconds to wait when blocking
+        """
+        super(BoundedQueueHandler, self).__init__(log_queue)
+        self.block = block
+        self.timeout = timeout
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merges the message arguments without formatting the record"""
+        data = structured_data(record)
+        record = copy.copy(record)
+        if data is not None:
+            record.data = data
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Puts a record in the queue, applying the drop/block policy"""
+        try:
+            self.queue.put(record, self.block, self.timeout)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RedactingQueueListener:
+    """
+    Background thread that redacts, formats and writes queued records
+    in batches
+    """
+
+    _sentinel = None
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        stream: TextIO = None,
+        fields: List[str] = PII_FIELDS,
+        batch_size: int = 512
+    ):
+        """Init method
+
+        Args:
+            log_queue (queue.Queue): queue filled by BoundedQueueHandler
+            stream (TextIO, optional): output stream. Defaults to stderr.
+            fields (List[str], optional): fields to redact
+            batch_size (int, optional): max records per write
+        """
+        self.queue = log_queue
+        self.stream = stream if stream is not None else sys.stderr
+        self.formatter = RedactingFormatter(fields)
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts the listener thread"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Writes pending records and stops the listener thread"""
+        if self._thread is None:
+            return
+        # a dead thread never frees room in a full queue
+        while self._thread.is_alive():
+            try:
+                self.queue.put(self._sentinel, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        """Drains the queue, one batch per write"""
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._sentinel in batch:
+                batch = batch[:batch.index(self._sentinel)]
+                running = False
+            if batch:
+                try:
+                    self.stream.write(
+                        self.formatter.format_batch(batch) + "\n")
+                    self.stream.flush()
+                except Exception:
+                    self._handle_error()
+
+    def _handle_error(self) -> None:
+        """Reports a failed write like logging.Handler.handleError"""
+        try:
+            sys.stderr.write("--- Logging error ---\n")
+            traceback.print_exc(file=sys.stderr)
+        except OSError:
+            pass
+
+
+def get_logger(
+    queue_size: int = 0,
+    block: bool = False
+) -> logging.Logger:
+    """Returns logger object
+
+    Calling it again returns the already configured logger.
+
+    Args:
+        queue_size (int, optional): when positive, records are put in a
+            queue of this size and written by a background listener.
+            Defaults to 0 (synchronous handler).
+        block (bool, optional): block callers when the queue is full
+            instead of dropping records. Defaults to False.
+    """
 
     logger = logging.getLogger("user_data")
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
+    if queue_size > 0:
+        log_queue = queue.Queue(queue_size)
+        handler = BoundedQueueHandler(log_queue, block)
+        handler.listener = RedactingQueueListener(log_queue)
+        handler.listener.start()
+        atexit.register(handler.listener.stop)
+        logger.addHandler(handler)
+        return logger
+
     handler = logging.StreamHandler()
     formatter = RedactingFormatter(PII_FIELDS)
 
@@ -80,6 +352,36 @@ def get_logger() -> logging.Logger:
 
 
 def get_db() -> mysql.connector.connection.MySQLConnection:
+    """
+    Checks a connection out of the process-wide pool,
+    closing it returns it to the pool
+    """
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        _pool = ConnectionPool(
+            _connection_factory or _connect,
+            int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE') or 5),
+            float(os.getenv('PERSONAL_DATA_DB_POOL_IDLE_TIMEOUT') or 300))
+    return _pool.get()
+
+
+def set_connection_factory(
+    factory: Callable[[], mysql.connector.connection.MySQLConnection] = None
+) -> None:
+    """Replaces the factory used by get_db() to open connections
+
+    Args:
+        factory (Callable, optional): opens a new connection.
+            Defaults to connecting to MySQL.
+    """
+    global _pool, _connection_factory
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.close()
+    _pool = None
+    _connection_factory = factory
+
+
+def _connect() -> mysql.connector.connection.MySQLConnection:
     """
     Connects to the database
     """
@@ -95,10 +397,315 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return connect
 
 
+def format_row(fields: Sequence[str], row: Sequence) -> str:
+    """Formats a users row as a `key=value;` log message
+
+    Args:
+        fields (Sequence[str]): column names
+        row (Sequence): column values
+
+    Returns:
+        str: log message
+    """
+    return "".join("{}={}; ".format(k, v) for k, v in zip(fields, row)).strip()
+
+
+def stream_rows(
+    db: mysql.connector.connection.MySQLConnection,
+    batch_size: int = 1000,
+    query: str = "SELECT * FROM users;",
+    params: Sequence = ()
+) -> Iterator[Tuple[Sequence[str], List[tuple]]]:
+    """Streams the users table in batches from an unbuffered cursor
+
+    Args:
+        db (MySQLConnection): database connection
+        batch_size (int, optional): rows per batch. Defaults to 1000.
+        query (str, optional): query to run. Defaults to all users.
+        params (Sequence, optional): query parameters
+
+    Yields:
+        Tuple[Sequence[str], List[tuple]]: column names and a batch of rows
+    """
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        fields = cursor.column_names
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield fields, rows
+    finally:
+        cursor.close()
+
+
+def _format_rows(
+    formatter: RedactingFormatter,
+    fields: Sequence[str],
+    rows: List[tuple]
+) -> str:
+    """Formats and redacts a batch of users rows by column name"""
+    records = []
+    for row in rows:
+        record = logging.LogRecord("user_data", logging.INFO, __file__, 0,
+                                   "", None, None)
+        record.data = dict(zip(fields, row))
+        records.append(record)
+    return formatter.format_batch(records) + "\n"
+
+
+def export_users(
+    db: mysql.connector.connection.MySQLConnection,
+    sink: TextIO = None,
+    batch_size: int = 1000,
+    progress: Callable[[int, float], None] = None,
+    query: str = "SELECT * FROM users;",
+    params: Sequence = ()
+) -> int:
+    """Exports the users table redacted, one batch at a time
+
+    Args:
+        db (MySQLConnection): database connection
+        sink (TextIO, optional): output stream. Defaults to stderr.
+        batch_size (int, optional): rows per batch. Defaults to 1000.
+        progress (Callable[[int, float], None], optional): called after
+            every batch with the rows written and the elapsed seconds
+        query (str, optional): query to run. Defaults to all users.
+        params (Sequence, optional): query parameters
+
+    Returns:
+        int: number of rows written
+    """
+    if sink is None:
+        sink = sys.stderr
+    formatter = RedactingFormatter(PII_FIELDS)
+    count = 0
+    start = time.monotonic()
+    for fields, rows in stream_rows(db, batch_size, query, params):
+        sink.write(_format_rows(formatter, fields, rows))
+        count += len(rows)
+        if progress is not None:
+            progress(count, time.monotonic() - start)
+    sink.flush()
+    return count
+
+
+def _shard_query(key: str, low, high) -> Tuple[str, tuple]:
+    """Returns the query and parameters selecting the users whose `key`
+    lies in [low, high), ordered by `key`. The first shard (`low` None)
+    also holds the rows without a key, the last one (`high` None) has
+    no upper bound.
+    """
+    column = "`{}`".format(key.replace("`", "``"))
+    clauses = []
+    params = []
+    if low is not None:
+        clauses.append("{} >= %s".format(column))
+        params.append(low)
+    if high is not None:
+        clauses.append("{} < %s".format(column))
+        params.append(high)
+    where = " AND ".join(clauses)
+    if low is None:
+        where = "{} IS NULL OR {}".format(column, where) if where else ""
+    if where:
+        where = " WHERE " + where
+    return "SELECT * FROM users{} ORDER BY {};".format(where, column), \
+        tuple(params)
+
+
+def _shard_bounds(
+    db: mysql.connector.connection.MySQLConnection,
+    key: str,
+    shard_size: int
+) -> list:
+    """Returns the `key` values splitting the users table in shards of
+    about `shard_size` rows, from a single ordered scan of the key
+
+    Args:
+        db (MySQLConnection): database connection
+        key (str): column the shards are ranges of
+        shard_size (int): rows per shard
+
+    Returns:
+        list: increasing shard boundaries
+    """
+    column = "`{}`".format(key.replace("`", "``"))
+    query = "SELECT {0} FROM users WHERE {0} IS NOT NULL " \
+        "ORDER BY {0};".format(column)
+    bounds = []
+    first = True
+    for _, rows in stream_rows(db, shard_size, query):
+        value = rows[0][0]
+        # rows sharing a key value all fall in the same shard
+        if not first and (not bounds or bounds[-1] != value):
+            bounds.append(value)
+        first = False
+    return bounds
+
+
+def _export_shard(
+    connect: Callable[[], mysql.connector.connection.MySQLConnection],
+    key: str,
+    low,
+    high,
+    batch_size: int,
+    path: str
+) -> int:
+    """Exports one shard of the users table from a worker process
+
+    Args:
+        connect (Callable): connection factory
+        key (str): column the shards are ranges of
+        low: first key of the shard, None for the first shard
+        high: first key of the next shard, None for the last shard
+        batch_size (int): rows per batch
+        path (str): shard output file
+
+    Returns:
+        int: rows written
+    """
+    db = connect()
+    try:
+        query, params = _shard_query(key, low, high)
+        with open(path, "w", buffering=1 << 20) as f:
+            return export_users(db, f, batch_size, query=query,
+                                params=params)
+    finally:
+        db.close()
+
+
+def export_users_parallel(
+    connect: Callable[[], mysql.connector.connection.MySQLConnection] = None,
+    workers: int = None,
+    sink: TextIO = None,
+    shard_dir: str = None,
+    batch_size: int = 1000,
+    progress: Callable[[int, float], None] = None,
+    key: str = "email"
+) -> int:
+    """Exports the users table redacted, ordered by `key` and split in
+    key ranges across a process pool, each worker using its own
+    connection
+
+    The boundaries come from one ordered scan of the key column, so
+    every row belongs to exactly one shard and each shard is read with
+    an indexed range instead of skipping the rows before an OFFSET.
+
+    Args:
+        connect (Callable, optional): picklable connection factory.
+            Defaults to get_db.
+        workers (int, optional): worker processes. Defaults to CPU count.
+        sink (TextIO, optional): ordered output stream used when
+            `shard_dir` is None. Defaults to stderr.
+        shard_dir (str, optional): directory receiving one
+            `users_<shard>.log` file per shard
+        batch_size (int, optional): rows per batch. Defaults to 1000.
+        progress (Callable[[int, float], None], optional): called after
+            every shard with the rows written and the elapsed seconds
+        key (str, optional): indexed column the shards are ranges of.
+            Defaults to "email".
+
+    Returns:
+        int: number of rows written
+    """
+    if connect is None:
+        connect = get_db
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if sink is None:
+        sink = sys.stderr
+
+    db = connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users;")
+        total = cursor.fetchone()[0]
+        cursor.close()
+        shard_size = max(batch_size, math.ceil(total / (workers * 4)))
+        bounds = _shard_bounds(db, key, shard_size)
+    finally:
+        db.close()
+
+    ranges = list(zip([None] + bounds, bounds + [None]))
+    with tempfile.TemporaryDirectory() as tmp:
+        # the ordered sink is fed from shard files, so the parent never
+        # holds more than one read buffer of redacted text
+        ordered = shard_dir is None
+        if ordered:
+            shard_dir = tmp
+        os.makedirs(shard_dir, exist_ok=True)
+        paths = [os.path.join(shard_dir, "users_{:05d}.log".format(i))
+                 for i in range(len(ranges))]
+
+        count = 0
+        start = time.monotonic()
+
+        def collect(future, path):
+            nonlocal count
+            count += future.result()
+            if ordered:
+                with open(path) as f:
+                    shutil.copyfileobj(f, sink, 1 << 20)
+                os.remove(path)
+            if progress is not None:
+                progress(count, time.monotonic() - start)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for (low, high), path in zip(ranges, paths):
+                pending.append((executor.submit(
+                    _export_shard, connect, key, low, high, batch_size,
+                    path), path))
+                if len(pending) >= 2 * workers:
+                    collect(*pending.popleft())
+            while pending:
+                collect(*pending.popleft())
+    sink.flush()
+    return count
+
+
+def _print_progress(count: int, elapsed: float) -> None:
+    """Prints export counters to stderr"""
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print("exported {} rows in {:.2f}s ({:.0f} rows/s)".format(
+        count, elapsed, rate), file=sys.stderr)
+
+
 def main():
     """Entry point"""
 
+    parser = argparse.ArgumentParser(description="Export redacted users")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the table in batches")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="rows fetched and written per batch")
+    parser.add_argument("--progress", action="store_true",
+                        help="report progress and throughput")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="export shards in parallel with N processes")
+    parser.add_argument("--shard-dir",
+                        help="write one output file per shard")
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        out = open(sys.stderr.fileno(), "w", buffering=1 << 20,
+                   closefd=False)
+        export_users_parallel(get_db, args.workers, out, args.shard_dir,
+                              args.batch_size,
+                              _print_progress if args.progress else None)
+        return
+
     db = get_db()
+    if args.stream:
+        out = open(sys.stderr.fileno(), "w", buffering=1 << 20,
+                   closefd=False)
+        export_users(db, out, args.batch_size,
+                     _print_progress if args.progress else None)
+        db.close()
+        return
+
     logger = get_logger()
 
     cursor = db.cursor()
@@ -106,8 +713,7 @@ def main():
 
     fields = cursor.column_names
     for row in cursor:
-        message = "".join("{}={}; ".format(k, v) for k, v in zip(fields, row))
-        logger.info(message.strip())
+        logger.info("", extra={"data": dict(zip(fields, row))})
     cursor.close()
     db.close()
 
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Defines a SQLite stand-in for the mysql.connector connection
+"""
+import sqlite3
+from typing import List, Sequence
+
+
+class LocalCursor:
+    """
+    Cursor exposing the subset of the mysql.connector cursor API
+    used by filtered_logger
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        """Init method"""
+        self._cursor = cursor
+        self.column_names = ()
+
+    def execute(self, operation: str, params: Sequence = ()) -> None:
+        """Executes a query, translating mysql placeholders
+
+        Args:
+            operation (str): SQL query
+            params (Sequence, optional): query parameters
+        """
+        self._cursor.execute(operation.replace("%s", "?"), tuple(params))
+        if self._cursor.description is not None:
+            self.column_names = tuple(d[0] for d in self._cursor.description)
+
+    def fetchone(self) -> tuple:
+        """Returns the next row"""
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int = 1) -> List[tuple]:
+        """Returns the next `size` rows"""
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self) -> List[tuple]:
+        """Returns all remaining rows"""
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        """Iterates over remaining rows"""
+        return iter(self._cursor)
+
+    def close(self) -> None:
+        """Closes the cursor"""
+        self._cursor.close()
+
+
+class LocalDB:
+    """
+    SQLite connection usable wherever get_db() is expected
+    """
+
+    def __init__(self, database: str = ":memory:"):
+        """Init method
+
+        Args:
+            database (str, optional): SQLite file path.
+                Defaults to ":memory:".
+        """
+        self._conn = sqlite3.connect(database, check_same_thread=False)
+
+    def cursor(self, buffered: bool = None) -> LocalCursor:
+        """Returns a new cursor, `buffered` is accepted and ignored"""
+        return LocalCursor(self._conn.cursor())
+
+    def commit(self) -> None:
+        """Commits the current transaction"""
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        """Rolls back the current transaction"""
+        self._conn.rollback()
+
+    def is_connected(self) -> bool:
+        """Returns True if the connection is usable"""
+        try:
+            self._conn.execute("SELECT 1")
+        except sqlite3.Error:
+            return False
+        return True
+
+    def close(self) -> None:
+        """Closes the connection"""
+        self._conn.close()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Redacts existing log files with the same rules as filter_datum
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_redactor
+
+CHUNK_SIZE = 8 << 20
+
+
+def chunk_boundaries(
+    data: mmap.mmap,
+    chunk_size: int = CHUNK_SIZE
+) -> List[Tuple[int, int]]:
+    """Splits a mapped file in chunks ending on line boundaries
+
+    Args:
+        data (mmap.mmap): mapped file
+        chunk_size (int, optional): approximate chunk size in bytes
+
+    Returns:
+        List[Tuple[int, int]]: (start, end) offsets of every chunk
+    """
+    size = len(data)
+    bounds = []
+    start = 0
+    while start < size:
+        end = data.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def redact_text(
+    text: str,
+    fields: Tuple[str, ...] = PII_FIELDS,
+    redaction: str = RedactingFormatter.REDACTION,
+    separator: str = RedactingFormatter.SEPARATOR
+) -> str:
+    """Redacts a block of log lines"""
+    return get_redactor(fields, redaction, separator)(text)
+
+
+def _redact_chunk(args: Tuple[str, int, int, Tuple[str, ...]]) -> bytes:
+    """Maps and redacts one chunk of a file from a worker process"""
+    path, start, end, fields = args
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = data[start:end].decode("utf-8", "surrogateescape")
+    return redact_text(text, fields).encode("utf-8", "surrogateescape")
+
+
+def redact_file(
+    src: str,
+    dst: BinaryIO,
+    fields: Tuple[str, ...] = PII_FIELDS,
+    workers: int = None,
+    chunk_size: int = CHUNK_SIZE
+) -> int:
+    """Redacts a log file in parallel, writing chunks in order
+
+    Args:
+        src (str): input file path
+        dst (BinaryIO): output stream
+        fields (Tuple[str, ...], optional): fields to redact
+        workers (int, optional): worker processes. Defaults to CPU count.
+        chunk_size (int, optional): approximate chunk size in bytes
+
+    Returns:
+        int: number of input bytes processed
+    """
+    if os.path.getsize(src) == 0:
+        return 0
+    with open(src, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            bounds = chunk_boundaries(data, chunk_size)
+    jobs = ((src, start, end, fields) for start, end in bounds)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_redact_chunk, jobs):
+            dst.write(chunk)
+    dst.flush()
+    return bounds[-1][1]
+
+
+def _read_blocks(src: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    """Reads a stream in blocks ending on line boundaries"""
+    rest = b""
+    while True:
+        block = src.read(chunk_size)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b"\n") + 1
+        if cut == 0:
+            rest = block
+            continue
+        rest = block[cut:]
+        yield block[:cut]
+    if rest:
+        yield rest
+
+
+def redact_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    fields: Tuple[str, ...] = PII_FIELDS,
+    chunk_size: int = 1 << 20
+) -> int:
+    """Redacts a stream one block of lines at a time
+
+    Args:
+        src (BinaryIO): input stream
+        dst (BinaryIO): output stream
+        fields (Tuple[str, ...], optional): fields to redact
+        chunk_size (int, optional): read size in bytes
+
+    Returns:
+        int: number of input bytes processed
+    """
+    count = 0
+    for block in _read_blocks(src, chunk_size):
+        text = block.decode("utf-8", "surrogateescape")
+        dst.write(redact_text(text, fields).encode("utf-8",
+                                                   "surrogateescape"))
+        count += len(block)
+    dst.flush()
+    return count
+
+
+def main():
+    """Entry point"""
+
+    parser = argparse.ArgumentParser(
+        description="Redact PII fields from existing log files")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="log file to redact, - for stdin")
+    parser.add_argument("-o", "--output", default="-",
+                        help="redacted output file, - for stdout")
+    parser.add_argument("-f", "--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to redact")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes, defaults to CPU count")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="approximate chunk size in bytes")
+    args = parser.parse_args()
+
+    fields = tuple(f for f in args.fields.split(",") if f)
+    if args.output == "-":
+        dst = sys.stdout.buffer
+    else:
+        dst = open(args.output, "wb")
+
+    start = time.monotonic()
+    try:
+        if args.input == "-":
+            count = redact_stream(sys.stdin.buffer, dst, fields)
+        else:
+            count = redact_file(args.input, dst, fields, args.workers,
+                                args.chunk_size)
+    finally:
+        if dst is not sys.stdout.buffer:
+            dst.close()
+    elapsed = time.monotonic() - start
+    rate = count / elapsed / (1 << 20) if elapsed > 0 else 0.0
+    print("redacted {} bytes in {:.2f}s ({:.1f} MB/s)".format(
+        count, elapsed, rate), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
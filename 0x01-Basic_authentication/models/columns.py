@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+""" Columnar storage engine module
+"""
+import threading
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime
+from itertools import compress
+from typing import Any, Iterator, List, Tuple
+
+from models.timestamp import Timestamp, timestamp_fields
+
+
+class StringTable():
+    """ Interned values of one column, each stored once and referred
+    to by an integer code
+    """
+
+    def __init__(self):
+        """ Initialize an empty table
+        """
+        self.values = []
+        self.codes = {}
+
+    def code(self, value: Any) -> int:
+        """ Return the code of a value, adding it if needed
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class ColumnCollection(MutableMapping):
+    """ Objects of one class stored column by column: timestamps in
+    integer arrays, other attributes as codes into interned tables.
+    Instances are only built when a row is accessed.
+
+    Every method holds an internal lock for the few statements that
+    touch the columns, so rows are never read half written.
+
+    Deleted rows and the values no row refers to any more are dropped
+    once they make up half of the collection.
+    """
+
+    def __init__(self, cls: type):
+        """ Initialize an empty ColumnCollection of `cls` rows
+        """
+        self._cls = cls
+        self._fields = [f for f in cls.FIELDS if f != 'id']
+        self._ids = []
+        self._rows = {}
+        self._garbage = 0
+        self._columns = {}
+        self._tables = {}
+        self._timestamps = timestamp_fields(cls)
+        self._lock = threading.RLock()
+        for field in self._fields:
+            if field in self._timestamps:
+                self._columns[field] = array('q')
+            else:
+                self._columns[field] = array('l')
+                self._tables[field] = StringTable()
+
+    def _encode(self, field: str, value: Any) -> int:
+        """ Return the column value of an attribute value
+        """
+        if field not in self._timestamps:
+            return self._tables[field].code(value)
+        return Timestamp.encode(value)
+
+    def _decode(self, field: str, value: int) -> Any:
+        """ Return the attribute value of a column value
+        """
+        if field in self._timestamps:
+            return value
+        return self._tables[field].values[value]
+
+    def set_raw(self, obj_id: str, obj_json: dict):
+        """ Store a row from its JSON dictionary
+        """
+        values = [(field, self._encode(field, obj_json.get(field)))
+                  for field in self._fields]
+        with self._lock:
+            row = self._rows.get(obj_id)
+            if row is None:
+                for field, value in values:
+                    self._columns[field].append(value)
+                self._ids.append(obj_id)
+                self._rows[obj_id] = len(self._ids) - 1
+                return
+            for field, value in values:
+                column = self._columns[field]
+                if field in self._tables and column[row] != value:
+                    # the previous value may be referred to no more
+                    self._garbage += 1
+                column[row] = value
+            self._collect()
+
+    def attribute(self, obj_id: str, name: str) -> Any:
+        """ Return an attribute of a row without building the object
+        """
+        if name == 'id':
+            return obj_id
+        with self._lock:
+            value = self._decode(name,
+                                 self._columns[name][self._rows[obj_id]])
+        if name in self._timestamps:
+            return Timestamp.from_epoch(value)
+        return value
+
+    def json_items(self) -> Iterator[Tuple[str, dict]]:
+        """ Yield (ID, serialized JSON) pairs without building objects
+        """
+        for obj_id in self:
+            obj_json = {'id': obj_id}
+            with self._lock:
+                row = self._rows.get(obj_id)
+                if row is None:
+                    continue
+                values = [(field, self._decode(field,
+                                               self._columns[field][row]))
+                          for field in self._fields]
+            for field, value in values:
+                if field in self._timestamps:
+                    value = Timestamp.to_string(value)
+                obj_json[field] = value
+            yield obj_id, obj_json
+
+    def search(self, attributes: dict) -> List[Any]:
+        """ Return the objects matching all attributes, filtering
+        column by column
+        """
+        with self._lock:
+            ids = self._mask(attributes)
+        if ids is None:
+            return None
+        return [obj for obj in map(self.get, ids) if obj is not None]
+
+    def _mask(self, attributes: dict) -> List[str]:
+        """ Return the IDs of the rows matching all attributes, or None
+        if some attribute has no column
+        """
+        mask = None
+        for key, value in attributes.items():
+            if key == 'id':
+                keep = [obj_id == value for obj_id in self._ids]
+            elif key not in self._columns:
+                return None
+            else:
+                if key in self._timestamps:
+                    if type(value) is not datetime:
+                        return []
+                    target = self._encode(key, value)
+                else:
+                    try:
+                        target = self._tables[key].codes.get(value)
+                    except TypeError:
+                        return None
+                    if target is None:
+                        return []
+                keep = list(map(target.__eq__, self._columns[key]))
+            if mask is None:
+                mask = keep
+            else:
+                mask = list(map(bool.__and__, mask, keep))
+        if mask is None:
+            return [obj_id for obj_id in self._ids if obj_id is not None]
+        return [obj_id for obj_id in compress(self._ids, mask)
+                if obj_id is not None]
+
+    def __getitem__(self, obj_id: str) -> Any:
+        """ Build the object of a row
+        """
+        kwargs = {'id': obj_id}
+        with self._lock:
+            row = self._rows[obj_id]
+            for field in self._fields:
+                kwargs[field] = self._decode(field, self._columns[field][row])
+        return self._cls(**kwargs)
+
+    def __setitem__(self, obj_id: str, obj: Any):
+        """ Store an object as a row
+        """
+        self.set_raw(obj_id, {f: getattr(obj, f, None) for f in self._fields})
+
+    def __delitem__(self, obj_id: str):
+        """ Delete a row
+        """
+        with self._lock:
+            row = self._rows.pop(obj_id)
+            self._ids[row] = None
+            self._garbage += 1
+            self._collect()
+
+    def _collect(self):
+        """ Compact once deleted rows and replaced values amount to half
+        the rows, the lock being held
+        """
+        if self._garbage > 1024 and self._garbage * 2 > len(self._ids):
+            self._compact()
+
+    def _compact(self):
+        """ Drop the deleted rows from every column and the values no
+        row refers to from every table
+        """
+        keep = [obj_id is not None for obj_id in self._ids]
+        for field, column in self._columns.items():
+            column = compress(column, keep)
+            table = self._tables.get(field)
+            if table is not None:
+                fresh = self._tables[field] = StringTable()
+                column = (fresh.code(table.values[c]) for c in column)
+            self._columns[field] = array(self._columns[field].typecode,
+                                         column)
+        self._ids = list(compress(self._ids, keep))
+        self._rows = {obj_id: row for row, obj_id in enumerate(self._ids)}
+        self._garbage = 0
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over IDs in insertion order
+        """
+        return (obj_id for obj_id in list(self._ids) if obj_id is not None)
+
+    def __len__(self) -> int:
+        """ Number of rows
+        """
+        return len(self._rows)
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Check an ID
+        """
+        return obj_id in self._rows
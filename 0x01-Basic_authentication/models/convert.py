@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+""" Convert .db_<Class> files between serializer formats
+
+Usage: python3 -m models.convert .db_User.json .db_User.bin
+"""
+import argparse
+
+from models.serializers import SERIALIZERS, read_items, write_items
+
+
+def convert(src: str, dst: str, serializer_name: str) -> int:
+    """ Convert the file `src` (any format) to `dst`
+
+    Return:
+      - the number of objects converted
+    """
+    items = list(read_items(src, True))
+    write_items(dst, items, SERIALIZERS[serializer_name])
+    return len(items)
+
+
+def main():
+    """ Entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert Base storage files between formats")
+    parser.add_argument("src", help="input file, format is detected")
+    parser.add_argument("dst", help="output file")
+    parser.add_argument("--to", choices=sorted(SERIALIZERS),
+                        help="output format, defaults to the dst extension")
+    args = parser.parse_args()
+
+    serializer_name = args.to
+    if serializer_name is None:
+        extensions = {s.extension: s.name for s in SERIALIZERS.values()}
+        serializer_name = extensions.get(args.dst.rsplit(".", 1)[-1], "json")
+    count = convert(args.src, args.dst, serializer_name)
+    print("{} objects written to {} ({})".format(count, args.dst,
+                                                 serializer_name))
+
+
+if __name__ == "__main__":
+    main()
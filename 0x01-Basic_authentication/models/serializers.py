@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+""" Serializers module
+"""
+import io
+import json
+import os
+import struct
+import warnings
+from os import path
+from typing import Any, BinaryIO, Iterable, Iterator, List, Tuple
+
+from models.lazy import iter_json_items
+
+try:
+    import msgpack
+except ImportError:
+    # the in-tree codec below is pure Python, slower than json: "binary"
+    # only pays off with the msgpack package of requirements.txt
+    msgpack = None
+
+Items = Iterable[Tuple[str, dict]]
+
+
+class JsonSerializer():
+    """ Plain JSON object of all objects by ID
+    """
+
+    name = "json"
+    extension = "json"
+
+    def dump(self, items: Items, f: BinaryIO):
+        """ Write (ID, JSON dictionary) pairs
+        """
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        json.dump(dict(items), text)
+        text.flush()
+        text.detach()
+
+    def load(self, f: BinaryIO, stream: bool = False) -> Iterator[Tuple]:
+        """ Read (ID, JSON dictionary) pairs, incrementally if `stream`
+        """
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        try:
+            if stream:
+                yield from iter_json_items(text)
+            else:
+                yield from json.load(text).items()
+        finally:
+            # `f` belongs to the caller
+            text.detach()
+
+
+class BinarySerializer():
+    """ Length-prefixed records, each a MessagePack encoded [ID, object],
+    encoded with the msgpack package when installed
+    """
+
+    name = "binary"
+    extension = "bin"
+    MAGIC = b"BASEBIN\x01"
+
+    def dump(self, items: Items, f: BinaryIO):
+        """ Write (ID, JSON dictionary) pairs
+        """
+        pack = packb if msgpack is None else msgpack.Packer().pack
+        header = struct.Struct("<I").pack
+        buf = bytearray(self.MAGIC)
+        for obj_id, obj_json in items:
+            payload = pack([obj_id, obj_json])
+            buf += header(len(payload))
+            buf += payload
+            if len(buf) >= 1 << 16:
+                f.write(buf)
+                buf.clear()
+        f.write(buf)
+
+    def load(self, f: BinaryIO, stream: bool = False) -> Iterator[Tuple]:
+        """ Read (ID, JSON dictionary) pairs, always incrementally
+        """
+        unpack = unpackb if msgpack is None else msgpack.unpackb
+        if f.read(len(self.MAGIC)) != self.MAGIC:
+            raise ValueError("not a binary Base file")
+        header = struct.Struct("<I")
+        while True:
+            data = f.read(4)
+            if len(data) < 4:
+                return
+            obj_id, obj_json = unpack(f.read(header.unpack(data)[0]))
+            yield obj_id, obj_json
+
+
+SERIALIZERS = {s.name: s for s in (JsonSerializer(), BinarySerializer())}
+
+
+def get_serializer(name: str):
+    """ Return a serializer by name
+    """
+    if name not in SERIALIZERS:
+        raise ValueError("unknown serializer: {}".format(name))
+    if name == "binary" and msgpack is None:
+        warnings.warn("the binary format is slower than json without the "
+                      "msgpack package", RuntimeWarning, stacklevel=2)
+    return SERIALIZERS[name]
+
+
+def detect(f: BinaryIO):
+    """ Return the serializer matching the content of an open file
+    """
+    magic = f.read(len(BinarySerializer.MAGIC))
+    f.seek(0)
+    if magic == BinarySerializer.MAGIC:
+        return SERIALIZERS["binary"]
+    return SERIALIZERS["json"]
+
+
+def read_items(file_path: str, stream: bool = False) -> Iterator[Tuple]:
+    """ Yield the (ID, JSON dictionary) pairs of a file of any format
+    """
+    with open(file_path, "rb") as f:
+        yield from detect(f).load(f, stream)
+
+
+def format_paths(file_path: str) -> List[str]:
+    """ Return the paths of a .db_<Class> file in every format
+    """
+    stem = file_path.rsplit(".", 1)[0]
+    return [stem + "." + s.extension for s in SERIALIZERS.values()]
+
+
+def find_file(file_path: str) -> str:
+    """ Return the most recently written existing file among the formats
+    of `file_path`, or None
+    """
+    existing = [p for p in format_paths(file_path) if path.exists(p)]
+    if len(existing) == 0:
+        return None
+    return max(existing, key=lambda p: os.stat(p).st_mtime_ns)
+
+
+def remove_other_formats(file_path: str):
+    """ Remove the files of the other formats once `file_path` has been
+    written, so that none of them is loaded stale
+    """
+    for other_path in format_paths(file_path):
+        if other_path != file_path and path.exists(other_path):
+            os.remove(other_path)
+
+
+def write_items(file_path: str, items: Items, serializer):
+    """ Write (ID, JSON dictionary) pairs to a temporary file,
+    then rename it over `file_path`
+    """
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        serializer.dump(items, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def packb(obj: Any) -> bytes:
+    """ Encode a JSON-compatible value as MessagePack
+    """
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def _pack(obj: Any, out: bytearray):
+    """ Append the MessagePack encoding of obj to out
+    """
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif type(obj) is int:
+        if 0 <= obj < 0x80 or -0x20 <= obj < 0:
+            out += struct.pack("b" if obj < 0 else "B", obj)
+        elif obj >= 0:
+            out += struct.pack(">BQ", 0xcf, obj)
+        else:
+            out += struct.pack(">Bq", 0xd3, obj)
+    elif type(obj) is float:
+        out += struct.pack(">Bd", 0xcb, obj)
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        _pack_header(len(data), out, 0xa0, 32, 0xd9, 0xda, 0xdb)
+        out += data
+    elif isinstance(obj, (list, tuple)):
+        _pack_header(len(obj), out, 0x90, 16, None, 0xdc, 0xdd)
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        _pack_header(len(obj), out, 0x80, 16, None, 0xde, 0xdf)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError("cannot serialize {}".format(type(obj).__name__))
+
+
+def _pack_header(size: int, out: bytearray, fix: int, fix_limit: int,
+                 code8: int, code16: int, code32: int):
+    """ Append a str/array/map header for `size` elements
+    """
+    if size < fix_limit:
+        out.append(fix | size)
+    elif code8 is not None and size < 0x100:
+        out += struct.pack(">BB", code8, size)
+    elif size < 0x10000:
+        out += struct.pack(">BH", code16, size)
+    else:
+        out += struct.pack(">BI", code32, size)
+
+
+_FIXED = {
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+    0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+    0xca: ">f", 0xcb: ">d",
+}
+_SIZED = {
+    0xd9: (">B", "str"), 0xda: (">H", "str"), 0xdb: (">I", "str"),
+    0xdc: (">H", "array"), 0xdd: (">I", "array"),
+    0xde: (">H", "map"), 0xdf: (">I", "map"),
+}
+
+
+def unpackb(data: bytes) -> Any:
+    """ Decode one MessagePack value
+    """
+    obj, _ = _unpack(data, 0)
+    return obj
+
+
+def _unpack(data: bytes, pos: int) -> Tuple[Any, int]:
+    """ Decode the value at `pos`, return it with the next position
+    """
+    code = data[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if code == 0xc0:
+        return None, pos
+    if code in (0xc2, 0xc3):
+        return code == 0xc3, pos
+    if code in _FIXED:
+        fmt = _FIXED[code]
+        value = struct.unpack_from(fmt, data, pos)[0]
+        return value, pos + struct.calcsize(fmt)
+    if code in _SIZED:
+        fmt, kind = _SIZED[code]
+        size = struct.unpack_from(fmt, data, pos)[0]
+        pos += struct.calcsize(fmt)
+    elif code & 0xe0 == 0xa0:
+        kind, size = "str", code & 0x1f
+    elif code & 0xf0 == 0x90:
+        kind, size = "array", code & 0x0f
+    elif code & 0xf0 == 0x80:
+        kind, size = "map", code & 0x0f
+    else:
+        raise ValueError("unsupported MessagePack type 0x{:02x}".format(code))
+
+    if kind == "str":
+        return data[pos:pos + size].decode("utf-8"), pos + size
+    if kind == "array":
+        result = []
+        for _ in range(size):
+            item, pos = _unpack(data, pos)
+            result.append(item)
+        return result, pos
+    result = {}
+    for _ in range(size):
+        key, pos = _unpack(data, pos)
+        result[key], pos = _unpack(data, pos)
+    return result, pos
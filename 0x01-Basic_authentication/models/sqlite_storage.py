@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Iterable, Iterator, List, Tuple
+
+from models.sorted_index import prefix_end
+from models.timestamp import Timestamp, timestamp_fields
+
+_local = threading.local()
+
+
+def connect(db_path: str, sync: bool = True) -> sqlite3.Connection:
+    """ Return the connection of the current thread to a database,
+    opening it in WAL and autocommit mode
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous={}".format(
+            "FULL" if sync else "NORMAL"))
+        connections[db_path] = conn
+    return conn
+
+
+def quote(name: str) -> str:
+    """ Return a quoted SQL identifier
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class SqliteCollection(MutableMapping):
+    """ Objects of one class stored as the rows of an SQLite table, one
+    column per field and an index on every attribute of INDEXES and
+    SORTED_INDEXES.
+    Nothing is kept in memory: objects are built from their row on
+    access, and every mutation is committed when it is made.
+
+    Each thread has its own connection, statements are constant SQL
+    with parameters so that sqlite3 reuses their prepared form.
+    """
+
+    def __init__(self, cls: type, db_path: str, sync: bool = True):
+        """ Initialize a SqliteCollection of `cls` rows in `db_path`,
+        creating or extending the table
+        """
+        self._cls = cls
+        self._db_path = db_path
+        self._sync = sync
+        self._fields = ('id',) + tuple(f for f in cls.FIELDS if f != 'id')
+        self._timestamps = timestamp_fields(cls)
+        self._table = quote(cls.__name__)
+        columns = ", ".join(map(quote, self._fields))
+        self._select = "SELECT {} FROM {}".format(columns, self._table)
+        self._upsert = (
+            "INSERT INTO {} ({}) VALUES ({}) "
+            "ON CONFLICT(id) DO UPDATE SET {}".format(
+                self._table, columns, ", ".join("?" * len(self._fields)),
+                ", ".join("{0} = excluded.{0}".format(quote(f))
+                          for f in self._fields[1:])))
+        self._create()
+
+    def _conn(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread
+        """
+        return connect(self._db_path, self._sync)
+
+    @contextmanager
+    def batch(self):
+        """ Commit the mutations made in the block in one transaction
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _create(self):
+        """ Create the table, its missing columns and its indexes
+        """
+        conn = self._conn()
+        with self.batch():
+            conn.execute("CREATE TABLE IF NOT EXISTS {} "
+                         "(id TEXT PRIMARY KEY)".format(self._table))
+            existing = {row[1] for row in conn.execute(
+                "PRAGMA table_info({})".format(self._table))}
+            for field in self._fields:
+                if field in existing:
+                    continue
+                kind = " INTEGER" if field in self._timestamps else ""
+                conn.execute("ALTER TABLE {} ADD COLUMN {}{}".format(
+                    self._table, quote(field), kind))
+            indexed = self._cls.INDEXES + self._cls.SORTED_INDEXES
+            for attr in dict.fromkeys(indexed):
+                if attr == 'id':
+                    # the primary key
+                    continue
+                conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    quote("{}_{}".format(self._cls.__name__, attr)),
+                    self._table, quote(attr)))
+            # generation of the table, bumped by triggers on every change
+            # whichever process or connection makes it
+            conn.execute("CREATE TABLE IF NOT EXISTS _generations "
+                         "(name TEXT PRIMARY KEY, generation INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO _generations VALUES (?, 0)",
+                         (self._cls.__name__,))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS {} AFTER {} ON {} BEGIN "
+                    "UPDATE _generations SET generation = generation + 1 "
+                    "WHERE name = '{}'; END".format(
+                        quote("{}_{}".format(self._cls.__name__,
+                                             event.lower())),
+                        event, self._table,
+                        self._cls.__name__.replace("'", "''")))
+
+    def _encode(self, field: str, value: Any) -> Any:
+        """ Return the column value of an attribute value
+        """
+        if field not in self._timestamps:
+            return value
+        return Timestamp.encode(value)
+
+    def _row(self, obj_id: str, obj_json: dict) -> list:
+        """ Return the column values of an object JSON dictionary
+        """
+        return [obj_id] + [self._encode(f, obj_json.get(f))
+                           for f in self._fields[1:]]
+
+    def _build(self, row: tuple) -> Any:
+        """ Build the object of a row
+        """
+        return self._cls(**dict(zip(self._fields, row)))
+
+    def set_raw(self, obj_id: str, obj_json: dict):
+        """ Store a row from its JSON dictionary
+        """
+        self._conn().execute(self._upsert, self._row(obj_id, obj_json))
+
+    def set_raw_many(self, items: Iterable[Tuple[str, dict]]):
+        """ Store rows from (ID, JSON dictionary) pairs in a single
+        transaction
+        """
+        with self.batch():
+            self._conn().executemany(self._upsert, (
+                self._row(obj_id, obj_json) for obj_id, obj_json in items))
+
+    def generation(self) -> int:
+        """ Return the number of changes made to the table
+        """
+        return self._conn().execute(
+            "SELECT generation FROM _generations WHERE name = ?",
+            (self._cls.__name__,)).fetchone()[0]
+
+    def attribute(self, obj_id: str, name: str) -> Any:
+        """ Return an attribute of a row without building the object
+        """
+        row = self._conn().execute("SELECT {} FROM {} WHERE id = ?".format(
+            quote(name), self._table), (obj_id,)).fetchone()
+        if row is None:
+            raise KeyError(obj_id)
+        if name in self._timestamps and row[0] is not None:
+            return Timestamp.from_epoch(row[0])
+        return row[0]
+
+    def json_items(self) -> Iterator[Tuple[str, dict]]:
+        """ Yield (ID, serialized JSON) pairs without building objects
+        """
+        cursor = self._conn().execute(self._select + " ORDER BY rowid")
+        for row in cursor:
+            obj_json = dict(zip(self._fields, row))
+            for field in self._timestamps:
+                if obj_json.get(field) is not None:
+                    obj_json[field] = Timestamp.to_string(obj_json[field])
+            yield row[0], obj_json
+
+    def search(self, attributes: dict) -> List[Any]:
+        """ Return the objects matching all attributes with a single
+        query, or None if some attribute has no column
+        """
+        return self.query(attributes)
+
+    def query(self, where: dict = {}, between: dict = {}, prefix: dict = {},
+              order_by: str = None, reverse: bool = False,
+              limit: int = None) -> List[Any]:
+        """ Return the objects matching the conditions of Base.query
+        with a single query, or None if some attribute has no column
+        """
+        clauses = []
+        params = []
+        for key in list(where) + list(between) + list(prefix) + [order_by]:
+            if key is not None and key not in self._fields:
+                return None
+        for key, value in where.items():
+            if key in self._timestamps and type(value) is not datetime:
+                return []
+            if value is None:
+                clauses.append("{} IS NULL".format(quote(key)))
+                continue
+            clauses.append("{} = ?".format(quote(key)))
+            params.append(self._encode(key, value))
+        for key, bounds in between.items():
+            for op, value in zip((">=", "<="), bounds):
+                if value is None:
+                    continue
+                if key in self._timestamps and type(value) is not datetime:
+                    return []
+                clauses.append("{} {} ?".format(quote(key), op))
+                params.append(self._encode(key, value))
+        for key, start in prefix.items():
+            if type(start) is not str:
+                return []
+            end = prefix_end(start)
+            clauses.append("{} >= ?".format(quote(key)))
+            params.append(start)
+            if end is None:
+                clauses.append("substr({}, 1, ?) = ?".format(quote(key)))
+                params += [len(start), start]
+            else:
+                clauses.append("{} < ?".format(quote(key)))
+                params.append(end)
+        sql = self._select
+        if len(clauses) > 0:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_by is None:
+            sql += " ORDER BY rowid"
+        else:
+            sql += " ORDER BY {0} IS NULL{1}, {0}{1}, rowid".format(
+                quote(order_by), " DESC" if reverse else "")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            rows = self._conn().execute(sql, params).fetchall()
+        except (sqlite3.InterfaceError, sqlite3.ProgrammingError):
+            # a value SQLite cannot compare, e.g. a list
+            return None
+        return [self._build(row) for row in rows]
+
+    def __getitem__(self, obj_id: str) -> Any:
+        """ Build the object of a row
+        """
+        row = self._conn().execute(self._select + " WHERE id = ?",
+                                   (obj_id,)).fetchone()
+        if row is None:
+            raise KeyError(obj_id)
+        return self._build(row)
+
+    def __setitem__(self, obj_id: str, obj: Any):
+        """ Store an object as a row
+        """
+        self._conn().execute(self._upsert, [obj_id] + [
+            self._encode(f, getattr(obj, f, None)) for f in self._fields[1:]])
+
+    def __delitem__(self, obj_id: str):
+        """ Delete a row
+        """
+        cursor = self._conn().execute(
+            "DELETE FROM {} WHERE id = ?".format(self._table), (obj_id,))
+        if cursor.rowcount == 0:
+            raise KeyError(obj_id)
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over IDs in insertion order
+        """
+        rows = self._conn().execute(
+            "SELECT id FROM {} ORDER BY rowid".format(self._table)).fetchall()
+        return (row[0] for row in rows)
+
+    def __len__(self) -> int:
+        """ Number of rows
+        """
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM {}".format(self._table)).fetchone()[0]
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Check an ID
+        """
+        try:
+            return self._conn().execute(
+                "SELECT 1 FROM {} WHERE id = ?".format(self._table),
+                (obj_id,)).fetchone() is not None
+        except (sqlite3.InterfaceError, sqlite3.ProgrammingError):
+            return False
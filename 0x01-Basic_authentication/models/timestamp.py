@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Timestamp attribute module
+"""
+from datetime import datetime, timedelta
+from typing import Any
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+
+
+class Timestamp():
+    """ Datetime attribute stored in the `_<name>` slot as integer
+    microseconds since the epoch, or as the raw TIMESTAMP_FORMAT string
+    until first access
+    """
+
+    def __set_name__(self, owner: type, name: str):
+        """ Remember the attribute and slot names
+        """
+        self.name = name
+        self.slot = "_" + name
+
+    def __get__(self, obj: object, owner: type = None) -> datetime:
+        """ Return the datetime, parsing it if needed
+        """
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if type(value) is str:
+            value = self.encode(value)
+            # same instant, the cached JSON of the object stays valid
+            object.__setattr__(obj, self.slot, value)
+        return self.from_epoch(value)
+
+    def __set__(self, obj: object, value: datetime):
+        """ Store a datetime or a TIMESTAMP_FORMAT string
+        """
+        if type(value) is datetime:
+            value = self.to_epoch(value)
+        setattr(obj, self.slot, value)
+
+    def format(self, obj: object) -> str:
+        """ Return the TIMESTAMP_FORMAT string of the attribute
+        """
+        value = getattr(obj, self.slot)
+        if type(value) is str:
+            return value
+        return self.to_string(value)
+
+    @staticmethod
+    def to_epoch(value: datetime) -> int:
+        """ Convert a naive UTC datetime to microseconds since the epoch
+        """
+        return (value - EPOCH) // timedelta(microseconds=1)
+
+    @staticmethod
+    def from_epoch(value: int) -> datetime:
+        """ Convert microseconds since the epoch to a naive UTC datetime
+        """
+        return EPOCH + timedelta(microseconds=value)
+
+    @classmethod
+    def encode(cls, value: Any) -> Any:
+        """ Convert a datetime or a TIMESTAMP_FORMAT string to
+        microseconds since the epoch, other values being left as is
+        """
+        if type(value) is str:
+            value = datetime.strptime(value, TIMESTAMP_FORMAT)
+        if type(value) is datetime:
+            value = cls.to_epoch(value)
+        return value
+
+    @classmethod
+    def to_string(cls, value: int) -> str:
+        """ Convert microseconds since the epoch to a TIMESTAMP_FORMAT
+        string
+        """
+        return cls.from_epoch(value).strftime(TIMESTAMP_FORMAT)
+
+
+def timestamp_fields(cls: type) -> tuple:
+    """ Return the names of the Timestamp attributes of a class
+    """
+    return tuple(f for f in cls.FIELDS
+                 if isinstance(getattr(cls, f, None), Timestamp))
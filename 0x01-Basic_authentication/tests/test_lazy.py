@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+""" Chunk boundary test of the incremental JSON reader, run from the
+project directory with: python3 -m unittest discover tests
+"""
+import io
+import json
+import unittest
+
+from models.lazy import iter_json_items
+
+
+class TestChunkBoundaries(unittest.TestCase):
+    """ Values cut at every chunk boundary
+    """
+
+    def test_every_chunk_size(self):
+        """ Any chunk size yields the same items as json.loads
+        """
+        text = json.dumps({"a": -2.5, "b": 1e-07, "c": [1.25, "x"],
+                           "d": 12345, "e": True, "f": None,
+                           "g": {"h": "i j"}, "k": 6.02e+23})
+        expected = list(json.loads(text).items())
+        for chunk_size in range(1, len(text) + 2):
+            with self.subTest(chunk_size=chunk_size):
+                items = iter_json_items(io.StringIO(text), chunk_size)
+                self.assertEqual(list(items), expected)
+
+    def test_number_cut_after_dot(self):
+        """ A float cut right after its "." is read whole
+        """
+        items = iter_json_items(io.StringIO('{"a": -2.5}'), 9)
+        self.assertEqual(list(items), [("a", -2.5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
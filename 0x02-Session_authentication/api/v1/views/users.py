@@ -1,20 +1,132 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
-from flask import abort, jsonify, request
+import hashlib
+import json
+from base64 import b64decode, urlsafe_b64encode
+from typing import Iterator, List, Optional
+
+from flask import Response, abort, jsonify, request
 
 from api.v1.views import app_views
 from models.user import User
 
 
+PAGE_SIZE = 100
+STREAM_BATCH_SIZE = 1000
+
+
+def _encode_cursor(user_id: str) -> str:
+    """ Return the opaque cursor of the page after a User ID
+    """
+    return urlsafe_b64encode(user_id.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    """ Return the User ID of a cursor, or None if it is invalid
+    """
+    try:
+        return b64decode(cursor + "=" * (-len(cursor) % 4), b"-_",
+                         validate=True).decode()
+    except ValueError:
+        return None
+
+
+def _users_after(after: str, limit: int) -> List[User]:
+    """ Return at most `limit` users with an ID greater than `after`
+    (None for the first page), in ID order
+    """
+    between = {} if after is None else {'id': (after, None)}
+    users = User.query(between=between, order_by='id', limit=limit + 1)
+    return [user for user in users if user.id != after][:limit]
+
+
+def _stream_users(after: str, limit: int) -> Iterator[str]:
+    """ Yield the JSON array of at most `limit` (None for all) users
+    after `after`, fetched STREAM_BATCH_SIZE at a time
+    """
+    yield "["
+    separator = ""
+    while limit is None or limit > 0:
+        size = STREAM_BATCH_SIZE
+        if limit is not None:
+            size = min(limit, size)
+            limit -= size
+        users = _users_after(after, size)
+        for user in users:
+            yield separator + json.dumps(user.to_json())
+            separator = ","
+        if len(users) < size:
+            break
+        after = users[-1].id
+    yield "]"
+
+
+def _not_modified(etag: str) -> Optional[Response]:
+    """ Return a 304 response if the If-None-Match header of the request
+    matches `etag`, else None
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: number of User objects per page
+      - after: cursor of a page, given by the Link header of the previous
+      - stream: 1 to send the JSON array while it is built
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, ordered by ID when
+        paginated or streamed, with an ETag changed by any User change
+      - 304 if the If-None-Match header matches the ETag
+      - 400 if a parameter is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    stream = request.args.get('stream') == "1"
+    etag = "{}-{}".format(User.generation(), hashlib.sha1(
+        request.query_string).hexdigest()[:16])
+    if limit is None and after is None and not stream:
+        response = _not_modified(etag)
+        if response is None:
+            all_users = [user.to_json() for user in User.all()]
+            response = jsonify(all_users)
+            response.set_etag(etag)
+        return response
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': "Wrong limit"}), 400
+    if after is not None:
+        after = _decode_cursor(after)
+        if after is None:
+            return jsonify({'error': "Wrong cursor"}), 400
+    response = _not_modified(etag)
+    if response is not None:
+        return response
+    if stream:
+        response = Response(_stream_users(after, limit),
+                            mimetype="application/json")
+        response.set_etag(etag)
+        return response
+
+    limit = limit or PAGE_SIZE
+    users = _users_after(after, limit)
+    response = jsonify([user.to_json() for user in users])
+    if len(users) == limit:
+        response.headers['Link'] = '<{}?limit={}&after={}>; rel="next"'.format(
+            request.base_url, limit, _encode_cursor(users[-1].id))
+    response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -23,7 +135,8 @@ def view_one_user(user_id: str = None) -> str:
     Path parameter:
       - User ID
     Return:
-      - User object JSON represented
+      - User object JSON represented, with an ETag changed by every save
+      - 304 if the If-None-Match header matches the ETag
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
@@ -32,12 +145,17 @@ def view_one_user(user_id: str = None) -> str:
         abort(404)
 
     if user_id == "me":
-        return jsonify(request.current_user.to_json())
-
-    user = User.get(user_id)
+        user = request.current_user
+    else:
+        user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = user.version()
+    response = _not_modified(etag)
+    if response is None:
+        response = jsonify(user.to_json())
+        response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -127,3 +245,103 @@ def update_user(user_id: str = None) -> str:
         user.last_name = rj.get('last_name')
     user.save()
     return jsonify(user.to_json()), 200
+
+
+def _batch_operation(op: dict, saves: dict, removes: dict,
+                     created: set) -> tuple:
+    """ Validate one operation of a batch and record its effect in
+    `saves` or `removes` (User objects by ID), updating copies of the
+    stored users, and the IDs of the new users in `created`
+    Return:
+      - status code and User object, or error message
+    """
+    if type(op) is not dict:
+        return 400, "Wrong format"
+    kind = op.get("op")
+    if kind == "create":
+        if op.get("email", "") == "":
+            return 400, "email missing"
+        if op.get("password", "") == "":
+            return 400, "password missing"
+        user = User()
+        user.email = op.get("email")
+        user.password = op.get("password")
+        user.first_name = op.get("first_name")
+        user.last_name = op.get("last_name")
+        saves[user.id] = user
+        created.add(user.id)
+        return 201, user
+    if kind not in ("update", "delete"):
+        return 400, "Wrong operation"
+
+    user_id = op.get("id")
+    user = None
+    if type(user_id) is str and user_id not in removes:
+        user = saves.get(user_id) or User.get(user_id)
+    if user is None:
+        return 404, "Not found"
+    if kind == "delete":
+        saves.pop(user_id, None)
+        removes[user_id] = user
+        return 200, None
+    if user_id not in saves:
+        # the live object only changes when bulk swaps the copy in
+        user = User(**user.to_json(True))
+    if op.get('first_name') is not None:
+        user.first_name = op.get('first_name')
+    if op.get('last_name') is not None:
+        user.last_name = op.get('last_name')
+    saves[user_id] = user
+    return 200, user
+
+
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def batch_users() -> str:
+    """ POST /api/v1/users/batch
+    JSON body:
+      - list of operations, applied in order:
+        - {"op": "create", "email", "password", "first_name" (optional),
+           "last_name" (optional)}
+        - {"op": "update", "id", "first_name" (optional),
+           "last_name" (optional)}
+        - {"op": "delete", "id"}
+    Every operation is validated before any is applied, the valid ones
+    are then applied together and persisted once.
+    Return:
+      - list of results in the order of the operations: status, and
+        User object JSON represented or error
+      - 400 if the body is not a list or the operations can't be applied
+    """
+    rj = None
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if type(rj) is not list:
+        return jsonify({'error': "Wrong format"}), 400
+
+    saves = {}
+    removes = {}
+    created = set()
+    outcomes = [_batch_operation(op, saves, removes, created) for op in rj]
+    try:
+        missing = User.bulk(
+            [u for u in saves.values() if u.id in created],
+            removes.values(),
+            [u for u in saves.values() if u.id not in created])
+    except Exception as e:
+        return jsonify({'error': "Can't apply operations: {}".format(e)}), 400
+
+    # updated users deleted by another request meanwhile
+    missing = {u.id for u in missing}
+    results = []
+    for status, outcome in outcomes:
+        if status < 400 and outcome is not None and outcome.id in missing:
+            status, outcome = 404, "Not found"
+        result = {'status': status}
+        if status >= 400:
+            result['error'] = outcome
+        elif outcome is not None:
+            result['user'] = outcome.to_json()
+        results.append(result)
+    return jsonify(results), 200
@@ -1,39 +1,177 @@
 #!/usr/bin/env python3
 """ Base module
 """
-import json
+import atexit
+import hashlib
+import logging
+import sys
+import threading
 import uuid
+from contextlib import nullcontext
 from datetime import datetime
-from os import path
-from typing import Iterable, List, TypeVar
+from itertools import islice
+from os import getenv
+from typing import Any, Iterable, List, Tuple, TypeVar
+
+from models.coherence import FileLock, signature
+from models.columns import ColumnCollection
+from models.lazy import LazyCollection
+from models.log_storage import LogStorage
+from models.serializers import (find_file, get_serializer, read_items,
+                                remove_other_formats, write_items)
+from models.sorted_index import SortedIndex
+from models.sqlite_storage import SqliteCollection
+from models.timestamp import TIMESTAMP_FORMAT, Timestamp
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEX = {}
+INDEX_KEYS = {}
+SORTED = {}
+LOGS = {}
+
+# Generation of each class, bumped under its write lock by every change
+# of its objects. Counters of different processes are told apart by the
+# token of this process, so with MULTIPROCESS the generation is rather
+# the state of the shared files the objects were last synced with.
+GENERATIONS = {}
+GENERATION_TOKEN = uuid.uuid4().hex[:8]
+
+# Writers (save, remove, load_from_file) of a class hold its write lock
+# while mutating DATA and the indexes. Readers never take it: they work
+# on atomic snapshots of the collections. save_to_file holds the persist
+# lock so that files are written in the order snapshots were taken.
+WRITE_LOCKS = {}
+PERSIST_LOCKS = {}
+_registry_lock = threading.Lock()
+
+# "json" rewrites the whole file on every mutation,
+# "log" appends each mutation to a log compacted in the background,
+# "sqlite" keeps each class in a table of the SQLITE_PATH database
+# instead of DATA (a .db_<Class> file is imported into an empty table)
+STORAGE = getenv("BASE_STORAGE", "json")
+LOG_COMPACT_BYTES = int(getenv("BASE_LOG_COMPACT_BYTES", 4 << 20))
+SQLITE_PATH = getenv("BASE_SQLITE_PATH", ".db.sqlite3")
+
+# format of .db_<Class> files written by save_to_file: "json" or "binary"
+# (only faster than json with the msgpack package installed), the newest
+# file of either format is read on load
+SERIALIZER = get_serializer(getenv("BASE_SERIALIZER", "json"))
+
+# parse files incrementally and build objects on first access
+LAZY_LOAD = getenv("BASE_LAZY_LOAD", "0") == "1"
+
+# in-memory engine of DATA: "dict" of objects, or "columns" storing
+# attributes column by column and building objects on access
+ENGINE = getenv("BASE_ENGINE", "dict")
+
+# "write" persists every mutation before save/remove return,
+# "group" marks the class dirty and lets a background flusher persist
+# every FLUSH_INTERVAL seconds or after FLUSH_COUNT mutations
+DURABILITY = getenv("BASE_DURABILITY", "write")
+FLUSH_INTERVAL = float(getenv("BASE_FLUSH_INTERVAL", 1.0))
+FLUSH_COUNT = int(getenv("BASE_FLUSH_COUNT", 100))
+DIRTY = {}
+_dirty_count = 0
+_dirty_cond = threading.Condition()
+_flush_lock = threading.Lock()
+_flusher = None
+
+# with BASE_MULTIPROCESS=1 several processes (e.g. server workers) share
+# the class files: writers hold an advisory lock on .db_<Class>.lock and
+# persist every mutation before releasing it, readers first catch up with
+# what other processes persisted, replaying the new log records or
+# reloading a file whose signature changed
+MULTIPROCESS = getenv("BASE_MULTIPROCESS", "0") == "1"
+FILE_LOCKS = {}
+SEEN = {}
+
+
+def flush():
+    """ Persist every class with pending mutations. A class that fails
+    to persist stays dirty, and the first error is raised once all
+    classes were tried.
+    """
+    global _dirty_count
+    error = None
+    with _flush_lock:
+        with _dirty_cond:
+            dirty = list(DIRTY.values())
+            DIRTY.clear()
+            _dirty_count = 0
+        for cls in dirty:
+            try:
+                cls._persist()
+            except Exception as e:
+                with _dirty_cond:
+                    DIRTY[cls.__name__] = cls
+                error = error or e
+    if error is not None:
+        raise error
+
+
+def _flush_loop():
+    """ Background flusher of the "group" durability mode, retrying
+    failed classes at the next interval
+    """
+    while True:
+        with _dirty_cond:
+            _dirty_cond.wait_for(lambda: _dirty_count >= FLUSH_COUNT,
+                                 FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logging.getLogger(__name__).exception("flush failed")
 
 
 class Base():
     """ Base class
     """
 
+    # _json caches the public dictionary built by to_json, dropped by any
+    # attribute assignment (save assigns updated_at). The serialized one
+    # is only built to be written, so it is not kept.
+    __slots__ = ('id', '_created_at', '_updated_at', '_json')
+
+    # Attributes serialized by to_json, in order
+    FIELDS = ('id', 'created_at', 'updated_at')
+
+    created_at = Timestamp()
+    updated_at = Timestamp()
+
+    # Attributes with a secondary hash index, kept up to date by
+    # save, remove and load_from_file (an SQL index with sqlite storage)
+    INDEXES = ()
+
+    # Attributes with a sorted index serving the range, prefix and
+    # ordering conditions of query, built on the first query then kept
+    # up to date like INDEXES
+    SORTED_INDEXES = ('id', 'created_at', 'updated_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA.setdefault(s_class, self.__class__._new_collection())
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        obj_id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = sys.intern(obj_id) if type(obj_id) is str else obj_id
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = kwargs.get('created_at')
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = kwargs.get('updated_at')
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value: Any):
+        """ Set an attribute, invalidating the cached JSON dictionary
+        """
+        object.__setattr__(self, name, value)
+        if name != '_json':
+            object.__setattr__(self, '_json', None)
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -46,10 +184,31 @@ class Base():
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        if for_serialization:
+            return self._build_json(True)
+        cache = getattr(self, '_json', None)
+        if cache is None:
+            # attached before reading the attributes: an assignment made
+            # meanwhile detaches it, so no stale dictionary is kept
+            cache = self._json = [None]
+        elif cache[0] is not None:
+            return dict(cache[0])
+        cache[0] = self._build_json(False)
+        return dict(cache[0])
+
+    def _build_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of the object
+        """
         result = {}
-        for key, value in self.__dict__.items():
+        cls = self.__class__
+        for key in cls.FIELDS:
             if not for_serialization and key[0] == '_':
                 continue
+            attr = getattr(cls, key, None)
+            if isinstance(attr, Timestamp):
+                result[key] = attr.format(self)
+                continue
+            value = getattr(self, key)
             if type(value) is datetime:
                 result[key] = value.strftime(TIMESTAMP_FORMAT)
             else:
@@ -61,50 +220,325 @@ class Base():
         """ Load all objects from file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        if DURABILITY == "group":
+            # pending mutations would be lost with the replaced DATA
+            flush()
+        with cls._file_lock():
+            file_path = cls._find_file()
+            objs = cls._new_collection()
+            objs_json = ()
+            if STORAGE == "log":
+                objs_json = cls._log().load().items()
+            elif STORAGE == "sqlite":
+                if file_path is not None and len(objs) == 0:
+                    objs_json = read_items(file_path, True)
+            elif file_path is not None:
+                SEEN[s_class] = signature(file_path)
+                objs_json = read_items(file_path, LAZY_LOAD)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+            if hasattr(objs, "set_raw_many"):
+                objs.set_raw_many(objs_json)
+                objs_json = ()
+            for obj_id, obj_json in objs_json:
+                if hasattr(objs, "set_raw"):
+                    objs.set_raw(obj_id, obj_json)
+                else:
+                    objs[obj_id] = cls(**obj_json)
+            with cls._write_lock():
+                DATA[s_class] = objs
+                cls._reindex(objs)
+                cls._bump()
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        if STORAGE == "sqlite":
+            # every mutation is already committed
+            return
+        with cls._file_lock(), cls._persist_lock():
+            with cls._write_lock():
+                objs = DATA[s_class]
+                objs_json = {}
+                if hasattr(objs, "json_items"):
+                    objs_json = dict(objs.json_items())
+                else:
+                    for obj_id, obj in objs.items():
+                        objs_json[obj_id] = obj.to_json(True)
+                if STORAGE == "log":
+                    # the log is cleared with the snapshot: a record
+                    # appended meanwhile would be lost
+                    cls._log().write_snapshot(objs_json)
+                    return
+            write_items(cls._file_path(), objs_json.items(), SERIALIZER)
+            remove_other_formats(cls._file_path())
+            if MULTIPROCESS:
+                SEEN[s_class] = signature(cls._file_path())
+
+    @classmethod
+    def _write_lock(cls) -> threading.RLock:
+        """ Return the lock held by writers of the class
+        """
+        return cls._class_lock(WRITE_LOCKS)
+
+    @classmethod
+    def _persist_lock(cls) -> threading.RLock:
+        """ Return the lock held while the class is written to disk
+        """
+        return cls._class_lock(PERSIST_LOCKS)
+
+    @classmethod
+    def _class_lock(cls, registry: dict) -> threading.RLock:
+        """ Return the lock of the class in a registry, creating it
+        """
+        lock = registry.get(cls.__name__)
+        if lock is None:
+            with _registry_lock:
+                lock = registry.setdefault(cls.__name__, threading.RLock())
+        return lock
+
+    @classmethod
+    def _file_lock(cls):
+        """ Return the lock shared with the other processes writing the
+        class files, a no-op unless MULTIPROCESS
+        """
+        if not MULTIPROCESS or STORAGE == "sqlite":
+            return nullcontext()
+        lock = FILE_LOCKS.get(cls.__name__)
+        if lock is None:
+            with _registry_lock:
+                lock = FILE_LOCKS.setdefault(
+                    cls.__name__, FileLock(".db_{}.lock".format(cls.__name__)))
+        return lock
+
+    @classmethod
+    def _sync(cls):
+        """ Catch up with the mutations persisted by other processes
+        """
+        if not MULTIPROCESS or STORAGE == "sqlite":
+            return
+        s_class = cls.__name__
+        if STORAGE != "log":
+            file_path = cls._find_file()
+            if file_path is not None and \
+                    signature(file_path) != SEEN.get(s_class):
+                cls.load_from_file()
+            return
+        with cls._write_lock():
+            records = cls._log().changes()
+            if records is not None:
+                cls._apply(records)
+                return
+        cls.load_from_file()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _apply(cls, records: List[dict]):
+        """ Apply log records to DATA and the indexes
+        """
+        objs = DATA.get(cls.__name__)
+        if objs is None:
+            objs = DATA.setdefault(cls.__name__, cls._new_collection())
+        if len(records) > 0:
+            cls._bump()
+        for record in records:
+            obj_id = record["id"]
+            if record["op"] == "save":
+                obj_json = record["obj"]
+                if hasattr(objs, "set_raw"):
+                    objs.set_raw(obj_id, obj_json)
+                else:
+                    objs[obj_id] = cls(**obj_json)
+                cls._index_put(obj_id, obj_json)
+            elif obj_id in objs:
+                del objs[obj_id]
+                cls._index_remove(obj_id)
+
+    @classmethod
+    def _new_collection(cls):
+        """ Return an empty DATA collection for the configured engine
+        """
+        if STORAGE == "sqlite":
+            return SqliteCollection(cls, SQLITE_PATH, DURABILITY != "group")
+        if ENGINE == "columns":
+            return ColumnCollection(cls)
+        if LAZY_LOAD:
+            return LazyCollection(cls)
+        return {}
+
+    @classmethod
+    def _file_path(cls, serializer=None) -> str:
+        """ Return the path of the class file in a serializer format
+        """
+        serializer = serializer or SERIALIZER
+        return ".db_{}.{}".format(cls.__name__, serializer.extension)
+
+    @classmethod
+    def _find_file(cls) -> str:
+        """ Return the most recently written class file of any format,
+        or None
+        """
+        return find_file(cls._file_path())
+
+    @classmethod
+    def _log(cls) -> LogStorage:
+        """ Return the append-only log storage of the class
+        """
+        s_class = cls.__name__
+        if LOGS.get(s_class) is None:
+            LOGS[s_class] = LogStorage(
+                cls._file_path(), LOG_COMPACT_BYTES,
+                DURABILITY != "group" or MULTIPROCESS, SERIALIZER,
+                cls._file_lock() if MULTIPROCESS else None)
+        return LOGS[s_class]
+
+    @classmethod
+    def _persist(cls):
+        """ Write the pending mutations of the class to disk
+        """
+        if STORAGE == "log":
+            cls._log().flush()
+        elif STORAGE == "json":
+            cls.save_to_file()
+
+    @classmethod
+    def _mark_dirty(cls):
+        """ Record a mutation to be persisted by the flusher
+        """
+        global _dirty_count, _flusher
+        with _dirty_cond:
+            DIRTY[cls.__name__] = cls
+            _dirty_count += 1
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, daemon=True)
+                _flusher.start()
+                atexit.register(flush)
+            if _dirty_count >= FLUSH_COUNT:
+                _dirty_cond.notify()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with self.__class__._file_lock():
+            self.__class__._sync()
+            with self.__class__._write_lock():
+                self.updated_at = datetime.utcnow()
+                DATA[s_class][self.id] = self
+                self.__class__._index_add(self)
+                self.__class__._bump()
+                if STORAGE == "log":
+                    self.__class__._log().append_save(self.id,
+                                                      self.to_json(True))
+            if DURABILITY == "group" and not MULTIPROCESS:
+                self.__class__._mark_dirty()
+            elif STORAGE == "json":
+                self.__class__.save_to_file()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with self.__class__._file_lock():
+            self.__class__._sync()
+            with self.__class__._write_lock():
+                if DATA[s_class].get(self.id) is None:
+                    return
+                del DATA[s_class][self.id]
+                self.__class__._index_remove(self.id)
+                self.__class__._bump()
+                if STORAGE == "log":
+                    self.__class__._log().append_remove(self.id)
+            if DURABILITY == "group" and not MULTIPROCESS:
+                self.__class__._mark_dirty()
+            elif STORAGE == "json":
+                self.__class__.save_to_file()
+
+    @classmethod
+    def bulk(cls, save: Iterable[TypeVar('Base')] = (),
+             remove: Iterable[TypeVar('Base')] = (),
+             update: Iterable[TypeVar('Base')] = ()
+             ) -> List[TypeVar('Base')]:
+        """ Save then remove many objects in a single critical section,
+        persisting the class once. The objects of `update` are only
+        saved if still stored, those no longer stored are returned.
+        """
+        s_class = cls.__name__
+        save = list(save)
+        remove = list(remove)
+        with cls._file_lock():
+            cls._sync()
+            objs = DATA[s_class]
+            batch = getattr(objs, "batch", nullcontext)
+            with cls._write_lock(), batch():
+                missing = []
+                for obj in update:
+                    if obj.id in objs:
+                        save.append(obj)
+                    else:
+                        # removed since it was read
+                        missing.append(obj)
+                records = []
+                now = datetime.utcnow()
+                for obj in save:
+                    obj.updated_at = now
+                    objs[obj.id] = obj
+                    cls._index_add(obj)
+                    records.append({"op": "save", "id": obj.id,
+                                    "obj": obj.to_json(True)})
+                for obj in remove:
+                    if objs.get(obj.id) is None:
+                        continue
+                    del objs[obj.id]
+                    cls._index_remove(obj.id)
+                    records.append({"op": "remove", "id": obj.id})
+                if len(records) > 0:
+                    cls._bump()
+                if STORAGE == "log" and len(records) > 0:
+                    cls._log().append_many(records)
+            if DURABILITY == "group" and not MULTIPROCESS:
+                cls._mark_dirty()
+            elif STORAGE == "json":
+                cls.save_to_file()
+        return missing
+
+    @classmethod
+    def generation(cls) -> str:
+        """ Return an opaque version of the objects of the class,
+        changed by every save or remove, comparable across processes
+        """
+        cls._sync()
+        objs = DATA.get(cls.__name__)
+        if hasattr(objs, "generation"):
+            return str(objs.generation())
+        if MULTIPROCESS:
+            # the same in every process that has caught up with the files
+            if STORAGE == "log":
+                state = cls._log().position
+            else:
+                state = SEEN.get(cls.__name__)
+            return hashlib.sha1(repr(state).encode()).hexdigest()[:16]
+        return "{}-{}".format(GENERATION_TOKEN,
+                              GENERATIONS.get(cls.__name__, 0))
+
+    @classmethod
+    def _bump(cls):
+        """ Record a change of the objects of the class, the write lock
+        being held
+        """
+        GENERATIONS[cls.__name__] = GENERATIONS.get(cls.__name__, 0) + 1
+
+    def version(self) -> str:
+        """ Return an opaque version of the object, changed by every save
+        """
+        return "{}-{}".format(self.id, Timestamp.to_epoch(self.updated_at))
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
+        cls._sync()
         return len(DATA[s_class].keys())
 
     @classmethod
@@ -118,6 +552,7 @@ class Base():
         """ Return one object by ID
         """
         s_class = cls.__name__
+        cls._sync()
         return DATA[s_class].get(id)
 
     @classmethod
@@ -134,4 +569,273 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        cls._sync()
+        candidates = cls._index_lookup(attributes)
+        if candidates is None and hasattr(DATA[s_class], "search"):
+            candidates = DATA[s_class].search(attributes)
+            if candidates is not None:
+                return candidates
+        if candidates is None:
+            candidates = cls._snapshot()
+        return list(filter(_search, candidates))
+
+    @classmethod
+    def query(cls, where: dict = {}, between: dict = {}, prefix: dict = {},
+              order_by: str = None, reverse: bool = False,
+              limit: int = None) -> List[TypeVar('Base')]:
+        """ Search objects with equal attributes (`where`), attributes
+        in an inclusive range (`between`, attribute to (low, high), None
+        for an open end) and string attributes starting with a prefix
+        (`prefix`), ordered by `order_by` and cut at `limit`
+        """
+        cls._sync()
+        objs = DATA[cls.__name__]
+        if hasattr(objs, "query"):
+            result = objs.query(where, between, prefix, order_by, reverse,
+                                limit)
+            if result is not None:
+                return result
+
+        def _query(obj):
+            for k, v in where.items():
+                if getattr(obj, k, None) != v:
+                    return False
+            for k, (low, high) in between.items():
+                value = getattr(obj, k, None)
+                try:
+                    if value is None or (low is not None and value < low) \
+                            or (high is not None and value > high):
+                        return False
+                except TypeError:
+                    return False
+            for k, start in prefix.items():
+                value = getattr(obj, k, None)
+                if type(value) is not str or type(start) is not str or \
+                        not value.startswith(start):
+                    return False
+            return True
+
+        driver, ids = cls._sorted_lookup(where, between, prefix, order_by,
+                                         reverse, limit)
+        if ids is None:
+            candidates = cls.search(where)
+        else:
+            candidates = (obj for obj in map(objs.get, ids)
+                          if obj is not None)
+        matches = filter(_query, candidates)
+        if order_by is None or order_by == driver:
+            return list(islice(matches, limit))
+
+        def _order(obj):
+            value = getattr(obj, order_by, None)
+            return (value is None, value)
+
+        return sorted(matches, key=_order, reverse=reverse)[:limit]
+
+    @classmethod
+    def _sorted_lookup(cls, where: dict, between: dict, prefix: dict,
+                       order_by: str, reverse: bool,
+                       limit: int) -> Tuple[str, List[str]]:
+        """ Return the attribute of the sorted index driving a query and
+        the candidate IDs it gives, in its order, or (None, None) if no
+        sorted index helps
+        """
+        sorted_index = cls._sorted_index()
+        ranged = [k for k in list(between) + list(prefix)
+                  if k in sorted_index]
+        if order_by in sorted_index and (order_by in ranged or not ranged):
+            driver = order_by
+        elif ranged:
+            driver = ranged[0]
+        else:
+            return None, None
+        if driver != order_by:
+            reverse = False
+            limit = None
+        elif where or len(between) + len(prefix) > 1:
+            # other conditions filter the candidates
+            limit = None
+
+        index = sorted_index[driver]
+        if driver in between:
+            low, high = between[driver]
+            ids = index.range(cls._sort_value(driver, low),
+                              cls._sort_value(driver, high), reverse, limit)
+        elif driver in prefix:
+            ids = None
+            if type(prefix[driver]) is str:
+                ids = index.prefix(prefix[driver], reverse, limit)
+        elif len(index) < len(DATA[cls.__name__]):
+            # objects with incomparable values are not in the index
+            return None, None
+        else:
+            ids = index.ordered(reverse, limit)
+        if ids is None:
+            return None, None
+        return driver, ids
+
+    @classmethod
+    def _snapshot(cls) -> List[TypeVar('Base')]:
+        """ Return the objects of the class as a list, safe to take
+        while other threads write
+        """
+        objs = DATA[cls.__name__]
+        if type(objs) is dict:
+            # a single C call, atomic under the GIL
+            return list(objs.values())
+        return [obj for obj in map(objs.get, list(objs)) if obj is not None]
+
+    @classmethod
+    def _index(cls) -> dict:
+        """ Return the secondary indexes of the class
+        """
+        s_class = cls.__name__
+        if INDEX.get(s_class) is None:
+            INDEX[s_class] = {attr: {} for attr in cls._indexed()}
+            INDEX_KEYS[s_class] = {}
+        return INDEX[s_class]
+
+    @classmethod
+    def _indexed(cls) -> tuple:
+        """ Return the attributes indexed in memory, none when SQLite
+        tables carry the indexes
+        """
+        if STORAGE == "sqlite":
+            return ()
+        return cls.INDEXES
+
+    @classmethod
+    def _reindex(cls, objs):
+        """ Rebuild the secondary indexes from a collection
+        """
+        index = {attr: {} for attr in cls._indexed()}
+        keys = {}
+        for obj_id in (list(objs) if len(index) > 0 else ()):
+            if hasattr(objs, "attribute"):
+                values = {k: objs.attribute(obj_id, k) for k in index}
+            else:
+                values = {k: getattr(objs[obj_id], k, None) for k in index}
+            keys[obj_id] = cls._index_values(index, obj_id, values)
+        INDEX_KEYS[cls.__name__] = keys
+        INDEX[cls.__name__] = index
+        # rebuilt from the new collection by the next query
+        SORTED.pop(cls.__name__, None)
+
+    @classmethod
+    def _sorted_index(cls) -> dict:
+        """ Return the sorted indexes of the class, building them from
+        DATA on first use
+        """
+        s_class = cls.__name__
+        sorted_index = SORTED.get(s_class)
+        if sorted_index is not None:
+            return sorted_index
+        with cls._write_lock():
+            sorted_index = SORTED.get(s_class)
+            if sorted_index is None:
+                objs = DATA.get(s_class, {})
+                sorted_index = {}
+                for attr in cls._sorted_indexed():
+                    items = []
+                    for obj_id in list(objs):
+                        if hasattr(objs, "attribute"):
+                            value = objs.attribute(obj_id, attr)
+                        else:
+                            value = getattr(objs[obj_id], attr, None)
+                        items.append((obj_id, cls._sort_value(attr, value)))
+                    sorted_index[attr] = SortedIndex(items)
+                SORTED[s_class] = sorted_index
+        return sorted_index
+
+    @classmethod
+    def _sorted_indexed(cls) -> tuple:
+        """ Return the attributes with a sorted index in memory, none
+        when queries run in SQLite
+        """
+        if STORAGE == "sqlite":
+            return ()
+        return cls.SORTED_INDEXES
+
+    @classmethod
+    def _sort_value(cls, attr: str, value: Any) -> Any:
+        """ Return the sorted index key of an attribute value: integer
+        microseconds for timestamps, the value itself otherwise
+        """
+        if isinstance(getattr(cls, attr, None), Timestamp):
+            return Timestamp.encode(value)
+        return value
+
+    @classmethod
+    def _index_add(cls, obj: TypeVar('Base')):
+        """ Index (or re-index) an object under its current values
+        """
+        attrs = list(cls._index())
+        if SORTED.get(cls.__name__) is not None:
+            attrs += list(SORTED[cls.__name__])
+        if len(attrs) == 0:
+            return
+        cls._index_put(obj.id, {k: getattr(obj, k, None) for k in attrs})
+
+    @classmethod
+    def _index_put(cls, obj_id: str, values: dict):
+        """ Index an object ID under the given attribute values
+        """
+        index = cls._index()
+        cls._index_remove(obj_id)
+        INDEX_KEYS[cls.__name__][obj_id] = cls._index_values(
+            index, obj_id, {k: values.get(k) for k in index})
+        for attr, sorted_index in SORTED.get(cls.__name__, {}).items():
+            sorted_index.put(obj_id, cls._sort_value(attr, values.get(attr)))
+
+    @staticmethod
+    def _index_values(index: dict, obj_id: str, values: dict) -> dict:
+        """ Add an object ID to the index buckets of its values,
+        return the values that could be indexed
+        """
+        keys = {}
+        for attr, value in values.items():
+            try:
+                index[attr].setdefault(value, {})[obj_id] = None
+            except TypeError:
+                continue
+            keys[attr] = value
+        return keys
+
+    @classmethod
+    def _index_remove(cls, obj_id: str):
+        """ Drop an object from the secondary indexes
+        """
+        for sorted_index in SORTED.get(cls.__name__, {}).values():
+            sorted_index.remove(obj_id)
+        index = cls._index()
+        keys = INDEX_KEYS[cls.__name__].pop(obj_id, None)
+        if keys is None:
+            return
+        for attr, value in keys.items():
+            bucket = index[attr].get(value)
+            if bucket is None:
+                continue
+            bucket.pop(obj_id, None)
+            if len(bucket) == 0:
+                del index[attr][value]
+
+    @classmethod
+    def _index_lookup(cls, attributes: dict) -> Iterable[TypeVar('Base')]:
+        """ Return the candidates for a search from the smallest index
+        bucket, or None if some queried attribute is not indexed
+        """
+        if len(attributes) == 0:
+            return None
+        index = cls._index()
+        if any(k not in index for k in attributes):
+            return None
+        best = None
+        for k, v in attributes.items():
+            try:
+                bucket = index[k].get(v, {})
+            except TypeError:
+                return None
+            if best is None or len(bucket) < len(best):
+                best = bucket
+        objs = DATA.get(cls.__name__, {})
+        return [obj for obj in map(objs.get, list(best)) if obj is not None]
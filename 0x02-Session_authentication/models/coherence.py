@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+""" Multi-process coherence module
+"""
+import fcntl
+import os
+import threading
+from typing import Tuple
+
+
+class FileLock():
+    """ Re-entrant advisory lock on a file, exclusive across processes
+    (flock) and across the threads of this process
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a FileLock on `file_path`, created if needed
+        """
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self) -> 'FileLock':
+        """ Acquire the lock
+        """
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT,
+                                   0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except Exception:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        """ Release the lock
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+def signature(file_path: str) -> Tuple[int, int, int]:
+    """ Return a cheap change marker of a file: inode, size and
+    modification time, or None if it does not exist
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
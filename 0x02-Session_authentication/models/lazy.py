@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+""" Lazy loading module
+"""
+import json
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Iterator, TextIO, Tuple
+
+
+def iter_json_items(f: TextIO,
+                    chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Any]]:
+    """ Yield the (key, value) pairs of a top-level JSON object,
+    reading the file incrementally
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        data = f.read(chunk_size)
+        if data == "":
+            eof = True
+        buf = buf[pos:] + data
+        pos = 0
+
+    def skip(chars: str = " \t\n\r"):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            # a number cut after "." or "e" decodes as its integer part
+            if (isinstance(value, (int, float)) and not eof and
+                    buf[end] not in " \t\n\r,}]"):
+                fill()
+                continue
+            pos = end
+            return value
+
+    def expect(char: str):
+        nonlocal pos
+        skip()
+        if pos >= len(buf) or buf[pos] != char:
+            raise ValueError("expected {!r} at offset {}".format(char, pos))
+        pos += 1
+
+    expect("{")
+    skip()
+    if pos < len(buf) and buf[pos] == "}":
+        return
+    while True:
+        skip()
+        key = decode()
+        expect(":")
+        skip()
+        yield key, decode()
+        skip()
+        if pos < len(buf) and buf[pos] == ",":
+            pos += 1
+            continue
+        expect("}")
+        return
+
+
+class LazyCollection(MutableMapping):
+    """ Objects of one class kept as raw JSON dictionaries by ID,
+    hydrated into instances on first access
+    """
+
+    def __init__(self, cls: type):
+        """ Initialize a LazyCollection of `cls` instances
+        """
+        self._cls = cls
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def set_raw(self, obj_id: str, obj_json: dict):
+        """ Store an object as its JSON dictionary
+        """
+        with self._lock:
+            self._items[obj_id] = obj_json
+
+    def attribute(self, obj_id: str, name: str) -> Any:
+        """ Return an attribute of an object without hydrating it
+        """
+        value = self._items[obj_id]
+        if type(value) is dict:
+            return value.get(name)
+        return getattr(value, name, None)
+
+    def json_items(self) -> Iterator[Tuple[str, dict]]:
+        """ Yield (ID, serialized JSON) pairs, reusing raw dictionaries
+        """
+        for obj_id, value in list(self._items.items()):
+            if type(value) is dict:
+                yield obj_id, value
+            else:
+                yield obj_id, value.to_json(True)
+
+    def __getitem__(self, obj_id: str) -> Any:
+        """ Return an object, hydrating it if needed
+        """
+        value = self._items[obj_id]
+        while type(value) is dict:
+            obj = self._cls(**value)
+            with self._lock:
+                # only swap if no writer replaced or removed it meanwhile
+                current = self._items[obj_id]
+                if current is value:
+                    self._items[obj_id] = obj
+                    return obj
+            value = current
+        return value
+
+    def __setitem__(self, obj_id: str, obj: Any):
+        """ Store an object
+        """
+        with self._lock:
+            self._items[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Delete an object
+        """
+        with self._lock:
+            del self._items[obj_id]
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over IDs
+        """
+        return iter(list(self._items))
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self._items)
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Check an ID without hydrating
+        """
+        return obj_id in self._items
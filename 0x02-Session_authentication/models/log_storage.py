@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+""" Append-only log storage module
+"""
+import json
+import os
+import threading
+from contextlib import nullcontext
+from os import path
+from typing import List
+
+from models.coherence import signature
+from models.serializers import (SERIALIZERS, find_file, format_paths,
+                                read_items, remove_other_formats,
+                                write_items)
+
+
+class LogStorage():
+    """ Snapshot file plus an append-only log of mutations
+
+    Every save or remove appends one JSON line to the log. Loading
+    replays the log on top of the last snapshot. Once the log grows past
+    `threshold` bytes it is rotated and folded into a new snapshot by a
+    background thread, the snapshot being replaced atomically.
+
+    When the files are shared by several processes, `shared` is a lock
+    held by the callers of append_save/append_remove and taken here to
+    load, rotate and compact, and changes() returns what the other
+    processes appended since the last load.
+    """
+
+    def __init__(self, snapshot_path: str, threshold: int = 4 << 20,
+                 sync: bool = True, serializer=SERIALIZERS["json"],
+                 shared=None):
+        """ Initialize a LogStorage for one class
+
+        With `sync` False, appended records stay buffered until flush().
+        The snapshot is written with `serializer`.
+        """
+        self.snapshot_path = snapshot_path
+        # named after the json snapshot whatever the format, so that the
+        # log outlives a change of serializer
+        self.log_path = format_paths(snapshot_path)[0] + ".log"
+        self.compacting_path = self.log_path + ".1"
+        self.threshold = threshold
+        self.sync = sync
+        self.serializer = serializer
+        self._lock = threading.Lock()
+        self.shared = shared
+        self.position = None
+        self._log = None
+        self._compactor = None
+
+    def load(self) -> dict:
+        """ Return the JSON dictionaries of all objects by ID
+        """
+        if self.shared is None:
+            self.wait()
+        with self._shared():
+            with self._lock:
+                self._truncate_torn()
+            objs_json = self._read_snapshot()
+            self._replay(self.compacting_path, objs_json)
+            self._replay(self.log_path, objs_json)
+            self.position = self._position()
+        return objs_json
+
+    def changes(self) -> List[dict]:
+        """ Return the records appended to the log since the last load
+        or call, or None if the files were rewritten meanwhile and a
+        full load is needed
+        """
+        if self.position is None:
+            return None
+        snapshot, compacting, log_ino, offset = self.position
+        if signature(self.snapshot_path) != snapshot or \
+                signature(self.compacting_path) != compacting:
+            return None
+        try:
+            f = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return [] if log_ino == 0 else None
+        with f:
+            st = os.fstat(f.fileno())
+            if log_ino not in (0, st.st_ino) or st.st_size < offset:
+                return None
+            f.seek(offset)
+            data = f.read()
+        # a record being appended has no newline yet
+        end = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:end].splitlines()]
+        self.position = (snapshot, compacting, st.st_ino, offset + end)
+        return records
+
+    def append_save(self, obj_id: str, obj_json: dict):
+        """ Append a saved object to the log
+        """
+        self.append_many([{"op": "save", "id": obj_id, "obj": obj_json}])
+
+    def append_remove(self, obj_id: str):
+        """ Append a removed object to the log
+        """
+        self.append_many([{"op": "remove", "id": obj_id}])
+
+    def write_snapshot(self, objs_json: dict):
+        """ Replace the snapshot with all objects and clear the log
+        """
+        if self.shared is None:
+            self.wait()
+        with self._shared(), self._lock:
+            self._close_log()
+            self._write_atomic(objs_json)
+            for file_path in (self.log_path, self.compacting_path):
+                if path.exists(file_path):
+                    os.remove(file_path)
+            self.position = self._position()
+
+    def flush(self):
+        """ Write buffered records to the log file
+        """
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+
+    def wait(self):
+        """ Wait for a running compaction to finish
+        """
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def append_many(self, records: List[dict]):
+        """ Append records with a single write, rotating the log past
+        the threshold
+        """
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self._lock:
+            if self.shared is not None and not self._log_is_current():
+                self._close_log()
+            if self._log is None:
+                self._log = open(self.log_path, 'a')
+            self._log.write(lines)
+            if self.sync:
+                self._log.flush()
+            if self._log.tell() >= self.threshold and \
+                    not path.exists(self.compacting_path):
+                self._close_log()
+                os.replace(self.log_path, self.compacting_path)
+                self._compactor = threading.Thread(target=self._compact,
+                                                   daemon=True)
+                self._compactor.start()
+            if self.shared is not None:
+                self.position = self._position()
+
+    def _compact(self):
+        """ Fold the rotated log into a new snapshot
+        """
+        with self._shared():
+            if not path.exists(self.compacting_path):
+                # already folded by a snapshot written meanwhile
+                return
+            objs_json = self._read_snapshot()
+            self._replay(self.compacting_path, objs_json)
+            self._write_atomic(objs_json)
+            os.remove(self.compacting_path)
+
+    def _shared(self):
+        """ Return the lock shared with other processes, if any
+        """
+        if self.shared is None:
+            return nullcontext()
+        return self.shared
+
+    def _position(self) -> tuple:
+        """ Return the current state of the files: signatures of the
+        snapshot and rotated log, inode and size of the log
+        """
+        log = signature(self.log_path) or (0, 0, 0)
+        return (signature(self.snapshot_path),
+                signature(self.compacting_path), log[0], log[1])
+
+    def _log_is_current(self) -> bool:
+        """ Check that the open log was not rotated by another process
+        """
+        if self._log is None:
+            return True
+        try:
+            return os.fstat(self._log.fileno()).st_ino == \
+                os.stat(self.log_path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _read_snapshot(self) -> dict:
+        """ Return the objects of the snapshot, read from the newest
+        file of any format
+        """
+        file_path = find_file(self.snapshot_path)
+        if file_path is None:
+            return {}
+        return dict(read_items(file_path))
+
+    def _write_atomic(self, objs_json: dict):
+        """ Write the snapshot to a temporary file then rename it
+        """
+        write_items(self.snapshot_path, objs_json.items(), self.serializer)
+        remove_other_formats(self.snapshot_path)
+
+    def _truncate_torn(self):
+        """ Cut a record torn by a crash off the end of the log, so that
+        the next append starts on a line of its own
+        """
+        if self._log is not None:
+            # a partly written buffer would look torn
+            self._log.flush()
+        try:
+            f = open(self.log_path, 'rb+')
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            size = end
+            while end > 0:
+                start = max(0, end - (1 << 16))
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                f.truncate(end)
+
+    def _close_log(self):
+        """ Close the open log file
+        """
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    @staticmethod
+    def _replay(file_path: str, objs_json: dict):
+        """ Apply the records of a log file to objs_json
+        """
+        if not path.exists(file_path):
+            return
+        with open(file_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn by a crash, the records after it still count
+                    continue
+                if record["op"] == "save":
+                    objs_json[record["id"]] = record["obj"]
+                else:
+                    objs_json.pop(record["id"], None)
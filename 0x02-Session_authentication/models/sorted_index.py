@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+""" Sorted index module
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import Any, List, Tuple
+
+
+def prefix_end(prefix: str) -> str:
+    """ Return the smallest string greater than every string starting
+    with `prefix`, or None if there is none
+    """
+    if len(prefix) == 0 or ord(prefix[-1]) == 0x10ffff:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class SortedIndex():
+    """ IDs of the objects of one class sorted by the value of one
+    attribute, kept in two parallel lists maintained with bisect.
+    Objects without a value are kept apart in insertion order, objects
+    with a value not comparable to the others are left out. Objects
+    with equal values stay in insertion order.
+    """
+
+    def __init__(self, items: List[Tuple[str, Any]] = ()):
+        """ Initialize a SortedIndex from (ID, value) pairs
+        """
+        self._values = []
+        self._ids = []
+        self._keys = {}
+        self._nulls = {}
+        self._lock = threading.Lock()
+        pairs = []
+        for obj_id, value in items:
+            if value is None:
+                self._nulls[obj_id] = None
+            else:
+                pairs.append((value, obj_id))
+        try:
+            pairs.sort(key=itemgetter(0))
+        except TypeError:
+            for value, obj_id in pairs:
+                self.put(obj_id, value)
+            return
+        self._values = [value for value, _ in pairs]
+        self._ids = [obj_id for _, obj_id in pairs]
+        self._keys = {obj_id: value for value, obj_id in pairs}
+
+    def put(self, obj_id: str, value: Any):
+        """ Index (or re-index) an object ID under a value
+        """
+        with self._lock:
+            self._remove(obj_id)
+            if value is None:
+                self._nulls[obj_id] = None
+                return
+            try:
+                i = bisect_right(self._values, value)
+            except TypeError:
+                return
+            self._values.insert(i, value)
+            self._ids.insert(i, obj_id)
+            self._keys[obj_id] = value
+
+    def remove(self, obj_id: str):
+        """ Drop an object ID
+        """
+        with self._lock:
+            self._remove(obj_id)
+
+    def _remove(self, obj_id: str):
+        """ Drop an object ID, the lock being held
+        """
+        self._nulls.pop(obj_id, None)
+        value = self._keys.pop(obj_id, None)
+        if value is None:
+            return
+        lo = bisect_left(self._values, value)
+        i = self._ids.index(obj_id, lo, bisect_right(self._values, value))
+        del self._values[i]
+        del self._ids[i]
+
+    def range(self, low: Any = None, high: Any = None,
+              reverse: bool = False, limit: int = None) -> List[str]:
+        """ Return the IDs with a value between `low` and `high`
+        included (None for an open end), in value order, or None if the
+        bounds cannot be compared with the values
+        """
+        with self._lock:
+            try:
+                lo = 0 if low is None else bisect_left(self._values, low)
+                hi = len(self._values) if high is None else \
+                    bisect_right(self._values, high)
+            except TypeError:
+                return None
+            return self._slice(lo, hi, reverse, limit)
+
+    def ordered(self, reverse: bool = False,
+                limit: int = None) -> List[str]:
+        """ Return all the IDs in value order, those without a value
+        last, or first if `reverse`
+        """
+        with self._lock:
+            nulls = list(self._nulls)
+            if reverse:
+                ids = nulls[:limit]
+            else:
+                ids = self._slice(0, len(self._ids), False, limit)
+            rest = None if limit is None else limit - len(ids)
+            if reverse:
+                ids += self._slice(0, len(self._ids), True, rest)
+            else:
+                ids += nulls[:rest]
+            return ids
+
+    def prefix(self, prefix: str, reverse: bool = False,
+               limit: int = None) -> List[str]:
+        """ Return the IDs with a string value starting with `prefix`,
+        in value order, or None if the values are not strings
+        """
+        end = prefix_end(prefix)
+        with self._lock:
+            try:
+                lo = bisect_left(self._values, prefix)
+                hi = len(self._values) if end is None else \
+                    bisect_left(self._values, end)
+            except TypeError:
+                return None
+            return self._slice(lo, hi, reverse, limit)
+
+    def _slice(self, lo: int, hi: int, reverse: bool,
+               limit: int) -> List[str]:
+        """ Return at most `limit` IDs of a range of positions, from the
+        end if `reverse`
+        """
+        if limit is not None:
+            if reverse:
+                lo = max(lo, hi - limit)
+            else:
+                hi = min(hi, lo + limit)
+        ids = self._ids[lo:hi]
+        if reverse:
+            ids.reverse()
+        return ids
+
+    def __len__(self) -> int:
+        """ Number of indexed IDs, with or without a value
+        """
+        return len(self._ids) + len(self._nulls)
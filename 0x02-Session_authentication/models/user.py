@@ -9,6 +9,13 @@ class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+
+    FIELDS = Base.FIELDS + __slots__
+
+    INDEXES = ('email',)
+    SORTED_INDEXES = Base.SORTED_INDEXES + ('email',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 """User Session model"""
+import sys
+
 from models.base import Base
 
 
 class UserSession(Base):
     """User Session class"""
 
+    __slots__ = ('user_id', 'session_id')
+
+    FIELDS = Base.FIELDS + __slots__
+
+    INDEXES = ('session_id',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize a new UserSession"""
         super().__init__(*args, **kwargs)
-        self.user_id = kwargs.get('user_id')
+        user_id = kwargs.get('user_id')
+        self.user_id = sys.intern(user_id) if type(user_id) is str else user_id
         self.session_id = kwargs.get('session_id')
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+""" Multithreaded stress test of the models storage, run from the
+project directory with: python3 -m unittest discover tests
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import unittest
+
+import models.base as base
+from models.user import User
+
+WRITERS = 4
+READERS = 3
+ROUNDS = 100
+
+# engine settings of models.base for every mode
+MODES = {
+    "dict": {},
+    "lazy": {"LAZY_LOAD": True},
+    "columns": {"ENGINE": "columns"},
+    "log": {"STORAGE": "log"},
+    "sqlite": {"STORAGE": "sqlite"},
+}
+
+
+class TestConcurrency(unittest.TestCase):
+    """ Writers, readers and a snapshot thread sharing User objects
+    """
+
+    def setUp(self):
+        """ Reset the store in a temporary directory
+        """
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.settings = {name: getattr(base, name) for name in (
+            "STORAGE", "ENGINE", "LAZY_LOAD", "DURABILITY", "MULTIPROCESS",
+            "SQLITE_PATH")}
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+
+    def tearDown(self):
+        """ Restore the settings and the working directory
+        """
+        sys.setswitchinterval(self.interval)
+        for name, value in self.settings.items():
+            setattr(base, name, value)
+        self._clear()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _clear():
+        """ Forget every loaded object and index
+        """
+        for registry in (base.DATA, base.INDEX, base.INDEX_KEYS,
+                         base.SORTED, base.LOGS, base.SEEN):
+            registry.clear()
+
+    def _configure(self, mode: str):
+        """ Switch models.base to a mode and load an empty store
+        """
+        base.STORAGE = "json"
+        base.ENGINE = "dict"
+        base.LAZY_LOAD = False
+        base.DURABILITY = "write"
+        base.MULTIPROCESS = False
+        base.SQLITE_PATH = os.path.join(self.tmp.name, ".db.sqlite3")
+        for name, value in MODES[mode].items():
+            setattr(base, name, value)
+        self._clear()
+        User.load_from_file()
+
+    def _stress(self) -> list:
+        """ Run the threads and return the exceptions they raised
+        """
+        errors = []
+        stop = threading.Event()
+
+        def guarded(func, *args):
+            try:
+                func(*args)
+            except Exception as e:
+                errors.append(e)
+
+        def writer(n):
+            mine = []
+            for i in range(ROUNDS):
+                user = User(email="w{}-{:03d}".format(n, i % 20),
+                            first_name="f{}".format(i % 3))
+                user.save()
+                mine.append(user)
+                roll = random.random()
+                if roll < 0.3:
+                    mine.pop(random.randrange(len(mine))).remove()
+                elif roll < 0.6:
+                    user = random.choice(mine)
+                    user.first_name = "f{}".format(i % 3)
+                    user.save()
+
+        def reader():
+            while not stop.is_set():
+                users = User.all()
+                User.count()
+                User.search({"first_name": "f1"})
+                User.search({"email": "w1-003"})
+                User.query(prefix={"email": "w2-"}, order_by="email")
+                User.query(order_by="created_at", reverse=True, limit=5)
+                for user in users[:5]:
+                    User.get(user.id)
+                    user.to_json()
+                # leave the writers some of the GIL
+                stop.wait(0.001)
+
+        def snapshot():
+            while not stop.is_set():
+                User.save_to_file()
+
+        watchers = [threading.Thread(target=guarded, args=(reader,))
+                    for _ in range(READERS)]
+        watchers.append(threading.Thread(target=guarded, args=(snapshot,)))
+        writers = [threading.Thread(target=guarded, args=(writer, n))
+                   for n in range(WRITERS)]
+        for thread in watchers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in watchers:
+            thread.join()
+        return errors
+
+    def _check(self, expected: dict):
+        """ Check that DATA and the indexes hold exactly `expected`
+        """
+        users = User.all()
+        self.assertEqual({u.id: u.to_json(True) for u in users}, expected)
+        self.assertEqual(set(base.DATA["User"]), set(expected))
+        self.assertEqual(User.count(), len(expected))
+        emails = {}
+        for obj_json in expected.values():
+            emails.setdefault(obj_json["email"], set()).add(obj_json["id"])
+        for email, ids in emails.items():
+            self.assertEqual({u.id for u in User.search({"email": email})},
+                             ids)
+        ordered = User.query(order_by="email")
+        self.assertEqual(len(ordered), len(expected))
+        self.assertEqual([u.email for u in ordered],
+                         sorted(o["email"] for o in expected.values()))
+        for n in range(WRITERS):
+            prefix = "w{}-".format(n)
+            self.assertEqual(
+                {u.id for u in User.query(prefix={"email": prefix})},
+                {i for e, ids in emails.items() if e.startswith(prefix)
+                 for i in ids})
+
+    def _run(self, mode: str):
+        """ No thread fails, the store and its reloaded files match
+        """
+        self._configure(mode)
+        self.assertEqual(self._stress(), [])
+        expected = {u.id: u.to_json(True) for u in User.all()}
+        self._check(expected)
+        # every mutation is on disk already, the snapshots included
+        self._clear()
+        User.load_from_file()
+        self._check(expected)
+
+    def test_dict(self):
+        """ Objects kept in a dict
+        """
+        self._run("dict")
+
+    def test_lazy(self):
+        """ Objects built on first access
+        """
+        self._run("lazy")
+
+    def test_columns(self):
+        """ Objects stored column by column
+        """
+        self._run("columns")
+
+    def test_log(self):
+        """ Mutations appended to a log
+        """
+        self._run("log")
+
+    def test_sqlite(self):
+        """ Objects stored in SQLite
+        """
+        self._run("sqlite")
+
+
+if __name__ == "__main__":
+    unittest.main()
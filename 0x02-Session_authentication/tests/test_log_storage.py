@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+""" Crash recovery test of the append-only log storage, run from the
+project directory with: python3 -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+from models.log_storage import LogStorage
+
+
+class TestTornLog(unittest.TestCase):
+    """ A record torn by a crash at the end of the log
+    """
+
+    def setUp(self):
+        """ Log a first object then tear the next record
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, ".db_User.json")
+        storage = LogStorage(self.path)
+        storage.load()
+        storage.append_save("a", {"id": "a"})
+        storage.flush()
+        with open(storage.log_path, "a") as f:
+            f.write('{"op": "save", "id": "x", "ob')
+
+    def tearDown(self):
+        """ Remove the files
+        """
+        self.tmp.cleanup()
+
+    def test_appends_after_restart(self):
+        """ Records appended after a restart survive the next load
+        """
+        storage = LogStorage(self.path)
+        self.assertEqual(list(storage.load()), ["a"])
+        storage.append_save("b", {"id": "b"})
+        storage.append_remove("a")
+        storage.append_save("c", {"id": "c"})
+        self.assertEqual(sorted(LogStorage(self.path).load()), ["b", "c"])
+
+    def test_compaction_after_restart(self):
+        """ The snapshot written after a restart keeps every record
+        """
+        storage = LogStorage(self.path)
+        storage.load()
+        storage.append_save("b", {"id": "b"})
+        storage.write_snapshot(LogStorage(self.path).load())
+        self.assertEqual(sorted(LogStorage(self.path).load()), ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
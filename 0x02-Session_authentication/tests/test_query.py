@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+""" Differential test of Base.query against a brute force search, run
+from the project directory with: python3 -m unittest discover tests
+"""
+import os
+import random
+import tempfile
+import unittest
+
+import models.base as base
+from models.user import User
+
+# engine settings of models.base for every mode
+MODES = {
+    "dict": {},
+    "lazy": {"LAZY_LOAD": True},
+    "columns": {"ENGINE": "columns"},
+    "log": {"STORAGE": "log"},
+    "sqlite": {"STORAGE": "sqlite"},
+}
+
+
+class TestQuery(unittest.TestCase):
+    """ Ordered queries over users, some without an email
+    """
+
+    def setUp(self):
+        """ Work in a temporary directory
+        """
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.settings = {name: getattr(base, name) for name in (
+            "STORAGE", "ENGINE", "LAZY_LOAD", "DURABILITY", "MULTIPROCESS",
+            "SQLITE_PATH")}
+
+    def tearDown(self):
+        """ Restore the settings and the working directory
+        """
+        for name, value in self.settings.items():
+            setattr(base, name, value)
+        self._clear()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _clear():
+        """ Forget every loaded object and index
+        """
+        for registry in (base.DATA, base.INDEX, base.INDEX_KEYS,
+                         base.SORTED, base.LOGS, base.SEEN):
+            registry.clear()
+
+    def _run(self, mode: str):
+        """ Every query returns what a brute force search does
+        """
+        base.STORAGE = "json"
+        base.ENGINE = "dict"
+        base.LAZY_LOAD = False
+        base.DURABILITY = "write"
+        base.MULTIPROCESS = False
+        base.SQLITE_PATH = os.path.join(self.tmp.name, ".db.sqlite3")
+        for name, value in MODES[mode].items():
+            setattr(base, name, value)
+        self._clear()
+        User.load_from_file()
+        rand = random.Random(0)
+        for i in range(200):
+            email = "e{:03d}".format(rand.randrange(80))
+            User(email=None if i % 7 == 0 else email,
+                 first_name="f{}".format(i % 3)).save()
+        # the sorted indexes now exist and follow the updates
+        User.query(order_by="email")
+        for i in range(20):
+            user = rand.choice(User.all())
+            user.email = None if i % 2 else "e{:03d}".format(i)
+            user.save()
+
+        users = User.all()
+        for where in ({}, {"first_name": "f1"}):
+            for prefix in ({}, {"email": "e0"}):
+                matches = [
+                    u for u in users
+                    if all(getattr(u, k) == v for k, v in where.items()) and
+                    all(type(u.email) is str and u.email.startswith(v)
+                        for v in prefix.values())]
+                for reverse in (False, True):
+                    expected = [u.email for u in sorted(
+                        matches, key=lambda u: (u.email is None, u.email),
+                        reverse=reverse)]
+                    for limit in (None, 0, 1, 5, 150, 300):
+                        with self.subTest(where=where, prefix=prefix,
+                                          reverse=reverse, limit=limit):
+                            result = User.query(where=where, prefix=prefix,
+                                                order_by="email",
+                                                reverse=reverse, limit=limit)
+                            self.assertEqual([u.email for u in result],
+                                             expected[:limit])
+
+    def test_dict(self):
+        """ Objects kept in a dict
+        """
+        self._run("dict")
+
+    def test_lazy(self):
+        """ Objects built on first access
+        """
+        self._run("lazy")
+
+    def test_columns(self):
+        """ Objects stored column by column
+        """
+        self._run("columns")
+
+    def test_log(self):
+        """ Mutations appended to a log
+        """
+        self._run("log")
+
+    def test_sqlite(self):
+        """ Objects stored in SQLite
+        """
+        self._run("sqlite")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 """Authentication methods module"""
+import statistics
+import time
+from os import getenv
 from typing import Union
 from uuid import uuid4
 
@@ -9,6 +12,68 @@ from sqlalchemy.orm.exc import NoResultFound
 from db import DB
 from user import User
 
+_cost = None
+
+
+def _calibrate_cost(
+    target: float = 0.25,
+    min_cost: int = 12,
+    max_cost: int = 16,
+    samples: int = 3
+) -> int:
+    """Returns the highest bcrypt cost whose hashing time on this host
+    fits the target latency, never lower than bcrypt's default of 12
+
+    Args:
+        target (float, optional): latency budget in seconds.
+            Defaults to 0.25.
+        min_cost (int, optional): lowest cost returned. Defaults to 12.
+        max_cost (int, optional): highest cost returned. Defaults to 16.
+        samples (int, optional): hashes timed per cost, the median
+            being kept. Defaults to 3.
+
+    Returns:
+        int: bcrypt cost factor
+    """
+    cost = min_cost
+    while cost < max_cost:
+        times = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.hashpw(b"calibration", bcrypt.gensalt(cost))
+            times.append(time.perf_counter() - start)
+        if statistics.median(times) * 2 > target:
+            break
+        cost += 1
+    return cost
+
+
+def _bcrypt_cost() -> int:
+    """Returns the bcrypt cost in use, calibrating it on first call
+
+    BCRYPT_COST skips calibration, BCRYPT_TARGET_SECONDS sets its target.
+    """
+    global _cost
+    if _cost is None:
+        if getenv('BCRYPT_COST'):
+            _cost = int(getenv('BCRYPT_COST'))
+        else:
+            _cost = _calibrate_cost(
+                float(getenv('BCRYPT_TARGET_SECONDS') or 0.25))
+    return _cost
+
+
+def _needs_rehash(hashed_password: bytes) -> bool:
+    """Checks if a hash was made with a cost lower than the current one
+
+    Args:
+        hashed_password (bytes): hashed password
+
+    Returns:
+        bool: True if the password should be hashed again
+    """
+    return int(hashed_password.split(b"$")[2]) < _bcrypt_cost()
+
 
 def _hash_password(password: str) -> bytes:
     """Hashes a password
@@ -19,7 +84,7 @@ def _hash_password(password: str) -> bytes:
     Returns:
         bytes: hashed password
     """
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(_bcrypt_cost()))
 
 
 def _generate_uuid() -> str:
@@ -74,9 +139,14 @@ class Auth:
         except NoResultFound:
             return False
 
-        if bcrypt.checkpw(password.encode(), user.hashed_password):
-            return True
-        return False
+        if not bcrypt.checkpw(password.encode(), user.hashed_password):
+            return False
+        if _needs_rehash(user.hashed_password):
+            self._db.update_user(
+                user.id,
+                hashed_password=_hash_password(password)
+            )
+        return True
 
     def create_session(self, email: str) -> str:
         """Creates a session for user